@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+"""
+Inverted-file (IVF) index for approximate nearest-neighbour matching in large face galleries
+"""
+
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Rows per chunk when assigning encodings to lists, bounds the temporary distance matrix
+ASSIGN_CHUNK = 8192
+
+
+def nearest_centroids(encodings, centroids, centroid_sq_norms):
+    """Index of the closest centroid for every encoding"""
+    assignments = np.empty(len(encodings), dtype=np.int32)
+    for start in range(0, len(encodings), ASSIGN_CHUNK):
+        chunk = encodings[start:start + ASSIGN_CHUNK]
+        # ||x||^2 is the same for every centroid, so it does not change the argmin
+        distances = chunk @ centroids.T
+        distances *= -2.0
+        distances += centroid_sq_norms
+        assignments[start:start + len(chunk)] = np.argmin(distances, axis=1)
+    return assignments
+
+
+def kmeans(samples, k, iterations=10, seed=0):
+    """Lloyd's k-means on float32 samples; empty clusters are re-seeded from random samples"""
+    rng = np.random.default_rng(seed)
+    centroids = samples[rng.choice(len(samples), k, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = nearest_centroids(samples, centroids, np.einsum('ij,ij->i', centroids, centroids))
+        counts = np.bincount(assignments, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, samples)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        if empty.any():
+            centroids[empty] = samples[rng.choice(len(samples), int(empty.sum()), replace=False)]
+    return centroids
+
+
+class IVFView:
+    """Immutable view of an IVFIndex, published with each gallery snapshot.
+
+    Lists are only appended to past the counts captured here, and rebuilt into
+    new arrays, so a view never changes under a reader.
+    """
+
+    def __init__(self, centroids, centroid_sq_norms, rows, vectors, sq_norms, counts, nprobe):
+        self.nprobe = nprobe
+        self._centroids = centroids
+        self._centroid_sq_norms = centroid_sq_norms
+        self._rows = rows
+        self._vectors = vectors
+        self._sq_norms = sq_norms
+        self._counts = counts
+
+    @property
+    def nlist(self):
+        return len(self._centroids)
+
+    def search(self, query, alive, k=1, nprobe=None):
+        """Up to k ``(rows, distances)`` of live gallery rows closest to one query, closest first.
+
+        Only the ``nprobe`` lists whose centroids are closest to the query are
+        scanned; distances to their members are exact.
+        """
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        centroid_distances = self._centroid_sq_norms - 2.0 * (self._centroids @ query)
+        if nprobe < self.nlist:
+            probe = np.argpartition(centroid_distances, nprobe - 1)[:nprobe]
+        else:
+            probe = range(self.nlist)
+
+        row_parts, distance_parts = [], []
+        for l in probe:
+            count = self._counts[l]
+            if not count:
+                continue
+            row_parts.append(self._rows[l][:count])
+            distance_parts.append(self._sq_norms[l][:count] - 2.0 * (self._vectors[l][:count] @ query))
+        if not row_parts:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+
+        rows = np.concatenate(row_parts)
+        distances = np.concatenate(distance_parts)
+        distances += np.dot(query, query)
+        distances[~alive[rows]] = np.inf
+        k = min(k, len(rows))
+        top = np.argpartition(distances, k - 1)[:k] if k < len(rows) else np.arange(len(rows))
+        top = top[np.argsort(distances[top])]
+        top = top[np.isfinite(distances[top])]
+        return rows[top], np.sqrt(np.maximum(distances[top], 0.0))
+
+
+class IVFIndex:
+    """Inverted-file index over the rows of a FaceGallery.
+
+    Encodings are clustered with k-means into ``nlist`` lists (about twice the
+    square root of the gallery size when 0); each list keeps float32 copies of
+    its members, so a query scans ``nprobe`` contiguous blocks instead of the
+    whole gallery. ``nprobe`` trades recall for latency. Rows are added
+    incrementally to the list of their nearest centroid; deleted rows stay in
+    their list, masked by the snapshot's alive flags, until the gallery
+    compacts and calls ``compact``. Not thread-safe: the gallery drives it
+    under its write lock.
+    """
+
+    def __init__(self, nlist=0, nprobe=8, min_size=20000, train_size=50000, iterations=10, seed=0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_size = min_size
+        self.train_size = train_size
+        self.iterations = iterations
+        self.seed = seed
+        self.trained_size = 0
+        self.size = 0  # gallery rows indexed so far
+        self._centroids = None
+        self._centroid_sq_norms = None
+        self._assign = np.zeros(0, dtype=np.int32)
+        self._rows = []
+        self._vectors = []
+        self._sq_norms = []
+        self._counts = np.zeros(0, dtype=np.int64)
+
+    @property
+    def trained(self):
+        return self._centroids is not None
+
+    def needs_training(self, live):
+        """True when the gallery reached min_size, or grew fourfold since training with an automatic nlist"""
+        if live < self.min_size:
+            return False
+        return not self.trained or (not self.nlist and live >= 4 * self.trained_size)
+
+    def train(self, encodings):
+        """Cluster a sample of encodings into the list centroids"""
+        nlist = self.nlist or int(np.clip(2 * np.sqrt(len(encodings)), 16, 4096))
+        nlist = min(nlist, len(encodings))
+        rng = np.random.default_rng(self.seed)
+        sample_size = min(len(encodings), max(self.train_size, 30 * nlist))
+        sample = encodings[np.sort(rng.choice(len(encodings), sample_size, replace=False))]
+        self._centroids = kmeans(np.ascontiguousarray(sample, dtype=np.float32), nlist, self.iterations, self.seed)
+        self._centroid_sq_norms = np.einsum('ij,ij->i', self._centroids, self._centroids)
+        self.trained_size = len(encodings)
+        logger.info(f"Trained IVF index with {nlist} lists on {sample_size} of {len(encodings)} encodings")
+
+    def build(self, encodings):
+        """Index gallery rows 0..len(encodings)-1 from scratch"""
+        self._assign = nearest_centroids(encodings, self._centroids, self._centroid_sq_norms)
+        self._group(encodings)
+
+    def _group(self, encodings):
+        nlist = len(self._centroids)
+        order = np.argsort(self._assign, kind='stable').astype(np.int32)
+        counts = np.bincount(self._assign, minlength=nlist)
+        self._rows, self._vectors, self._sq_norms = [], [], []
+        start = 0
+        for count in counts.tolist():
+            members = order[start:start + count]
+            start += count
+            # Headroom so incremental adds rarely reallocate
+            capacity = count + count // 4 + 8
+            rows = np.zeros(capacity, dtype=np.int32)
+            vectors = np.zeros((capacity, encodings.shape[1]), dtype=np.float32)
+            sq_norms = np.zeros(capacity, dtype=np.float32)
+            rows[:count] = members
+            vectors[:count] = encodings[members]
+            sq_norms[:count] = np.einsum('ij,ij->i', vectors[:count], vectors[:count])
+            self._rows.append(rows)
+            self._vectors.append(vectors)
+            self._sq_norms.append(sq_norms)
+        self._counts = counts.astype(np.int64)
+        self.size = len(self._assign)
+
+    def add(self, encodings):
+        """Index the gallery rows appended since the last call"""
+        if not len(encodings):
+            return
+        assignments = nearest_centroids(encodings, self._centroids, self._centroid_sq_norms)
+        self._assign = np.concatenate([self._assign, assignments])
+        for offset, l in enumerate(assignments.tolist()):
+            count = self._counts[l]
+            if count == len(self._rows[l]):
+                # New arrays; views holding the old ones stay consistent
+                capacity = 2 * count + 8
+                for lists in (self._rows, self._vectors, self._sq_norms):
+                    old = lists[l]
+                    new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+                    new[:count] = old[:count]
+                    lists[l] = new
+            encoding = encodings[offset]
+            self._rows[l][count] = self.size + offset
+            self._vectors[l][count] = encoding
+            self._sq_norms[l][count] = np.dot(encoding, encoding)
+            self._counts[l] = count + 1
+        self.size += len(encodings)
+
+    def compact(self, rows, encodings):
+        """Follow a gallery compaction that kept ``rows`` (old row numbers, in order) as rows 0..n-1"""
+        self._assign = self._assign[rows]
+        self._group(encodings)
+
+    def view(self):
+        return IVFView(self._centroids, self._centroid_sq_norms, tuple(self._rows), tuple(self._vectors),
+                       tuple(self._sq_norms), self._counts.copy(), self.nprobe)
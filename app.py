@@ -3,15 +3,35 @@ import cv2
 import face_recognition
 import numpy as np
 import os
+import re
 import time
 import sqlite3
 from datetime import datetime
 import base64
+import csv
+import io
 import json
 import logging
 from werkzeug.utils import secure_filename
 import threading
 import queue
+from ann import IVFIndex
+from gallery import FaceGallery
+from streaming import DEFAULT_RENDITIONS, FrameBroadcaster
+from recognition import RecognitionStage
+from database import (init_database, connect, encoding_to_blob, load_face_encodings, ConnectionPool,
+                      RecognitionLogWriter, LogRetentionJob, rename_identity_rollups, delete_identity_rollups,
+                      recognition_log_filter, query_recognition_logs, iter_recognition_logs)
+from face_cache import EncodingCache
+from tracker import FaceTracker
+from scheduler import AdaptiveCadence
+from live_stats import RecognitionStats
+from events import EventHub
+from profiles import ProfileManager
+from overlay import draw_faces
+from frame_sources import create_frame_source
+from metrics import MetricsRegistry
+from motion import MotionDetector
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-here'
@@ -39,62 +59,111 @@ app.config['MAX_CONTENT_LENGTH'] = config.get('ui', {}).get('max_upload_size_mb'
 log_level = getattr(logging, config.get('logging', {}).get('level', 'INFO'))
 logger.setLevel(log_level)
 
+# Hot-loop metrics exported on /metrics; gauges read their value when scraped
+metrics_registry = MetricsRegistry()
+stage_seconds = metrics_registry.histogram(
+    'facerec_stage_seconds', "Time spent in each pipeline stage per frame", ('camera', 'stage'))
+frames_captured = metrics_registry.counter(
+    'facerec_frames_captured_total', "Frames read from the frame source", ('camera',))
+frames_processed = metrics_registry.counter(
+    'facerec_frames_processed_total', "Captured frames annotated by the processing loop", ('camera',))
+frames_skipped = metrics_registry.counter(
+    'facerec_frames_skipped_total', "Captured frames replaced by a newer one before the processing loop took them",
+    ('camera',))
+frames_static = metrics_registry.counter(
+    'facerec_frames_static_total', "Frames due for recognition that were skipped because nothing moved", ('camera',))
+camera_reconnects = metrics_registry.counter(
+    'facerec_camera_reconnects_total', "Attempts to reopen a camera that failed or was lost", ('camera',))
+
 # Thread-safe camera manager
 class CameraManager:
-    def __init__(self):
+    def __init__(self, camera_config=None, camera_id='default'):
+        self.camera_config = config.get('camera', {}) if camera_config is None else camera_config
+        self.camera_id = camera_id
         self.camera = None
         self.lock = threading.Lock()
         self.current_frame = None
         self.frame_lock = threading.Lock()
+        self.frame_ready = threading.Condition(self.frame_lock)
+        self.frame_seq = 0
         self.is_running = False
+        self.capture_thread = None
         self.last_init_time = 0
+        self.init_attempts = 0
         self.init_cooldown = 2  # seconds between reinit attempts
-        self.initialize_camera()
+        self.finished = False  # set when recorded media has played to its end
+        # The device is opened on first read, so importing this module (e.g. in
+        # recognition worker processes) never grabs the camera
         
     def initialize_camera(self):
-        camera_config = config.get('camera', {})
-        # Simple camera initialization - avoid DirectShow which can cause issues
+        """Open the frame source configured in the camera section (a device, recorded media or a stream)"""
         try:
-            self.camera = cv2.VideoCapture(camera_config.get('index', 0))
-            
-            # Check if camera opened successfully
-            if not self.camera.isOpened():
-                logger.error("Failed to open camera at index 0")
-                # Try alternative camera indices
-                for i in range(1, 5):
-                    logger.info(f"Trying camera index {i}")
-                    self.camera = cv2.VideoCapture(i)
-                    if self.camera is not None and self.camera.isOpened():
-                        logger.info(f"Camera opened successfully with index {i}")
-                        break
+            self.camera = create_frame_source(self.camera_config)
+            if self.camera.open():
+                logger.info(f"Frame source initialized successfully: {self.camera.description}")
+                return
         except Exception as e:
             logger.error(f"Error initializing camera: {e}")
-            self.camera = None
         
-        if self.camera is not None and self.camera.isOpened():
-            # Optimize for performance with lower resolution
-            self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, camera_config.get('width', 640))
-            self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, camera_config.get('height', 480))
-            self.camera.set(cv2.CAP_PROP_FPS, camera_config.get('fps', 30))
-            
-            # Ultra-low latency settings
-            self.camera.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-            # Don't force MJPEG - let camera use default codec
-            
-            # Skip advanced camera settings to avoid conflicts
-            # Most cameras work better with default settings
-            
-            logger.info("Camera initialized successfully")
-        else:
-            logger.error("Failed to initialize any camera")
+        logger.error("Failed to initialize any camera")
+        if self.camera is not None:
+            self.camera.release()
+            self.camera = None
         
+    def start(self):
+        """Start the background thread that keeps grabbing the newest frame"""
+        with self.lock:
+            if self.is_running:
+                return
+            self.is_running = True
+            self.capture_thread = threading.Thread(target=self._capture_loop, name="camera-capture", daemon=True)
+            self.capture_thread.start()
+            logger.info("Camera capture thread started")
+    
+    def _capture_loop(self):
+        while self.is_running:
+            success, _ = self.read_frame(copy=False)
+            if not success and self.finished:
+                logger.info("Frame source finished, stopping capture")
+                self.is_running = False
+            elif not success:
+                # Camera unavailable - wait before the next reinit attempt
+                time.sleep(0.1)
+    
+    def wait_for_frame(self, last_seq, timeout=1.0):
+        """Wait for a frame newer than last_seq; returns (seq, frame) or (last_seq, None) on timeout.
+        
+        The returned frame is shared with other readers and must not be modified.
+        """
+        with self.frame_ready:
+            if not self.frame_ready.wait_for(lambda: self.frame_seq != last_seq, timeout):
+                return last_seq, None
+            return self.frame_seq, self.current_frame
+    
     def get_frame(self):
+        """Get a fresh frame that the caller may modify"""
+        if self.is_running:
+            with self.frame_lock:
+                last_seq = self.frame_seq
+            seq, frame = self.wait_for_frame(last_seq)
+            if frame is None:
+                return False, None
+            return True, frame.copy()
+        return self.read_frame()
+    
+    def read_frame(self, copy=True):
+        """Read directly from the camera, reinitializing it if needed"""
         with self.lock:
-            if self.camera is None or not self.camera.isOpened():
+            if self.finished:
+                return False, None
+            if self.camera is None or not self.camera.is_opened():
                 # Try to reinitialize camera if enough time has passed
                 current_time = time.time()
                 if current_time - self.last_init_time > self.init_cooldown:
                     logger.info("Attempting to reinitialize camera...")
+                    if self.init_attempts:
+                        camera_reconnects.inc(camera=self.camera_id)
+                    self.init_attempts += 1
                     self.initialize_camera()
                     self.last_init_time = current_time
                 else:
@@ -104,12 +173,24 @@ class CameraManager:
                 return False, None
                 
             try:
+                start = time.perf_counter()
                 ret, frame = self.camera.read()
+                stage_seconds.observe(time.perf_counter() - start, camera=self.camera_id, stage='capture')
                 if ret and frame is not None and frame.size > 0:
-                    with self.frame_lock:
-                        self.current_frame = frame.copy()
-                    return ret, frame
+                    frames_captured.inc(camera=self.camera_id)
+                    with self.frame_ready:
+                        self.current_frame = frame
+                        self.frame_seq += 1
+                        self.frame_ready.notify_all()
+                    # current_frame is shared with readers, hand out a private copy
+                    return ret, frame.copy() if copy else frame
                 else:
+                    if self.camera.finished:
+                        # Recorded media played to its end - keep it closed
+                        self.finished = True
+                        self.camera.release()
+                        self.camera = None
+                        return False, None
                     logger.error("Failed to read valid frame from camera")
                     # Mark camera as needing reinitialization
                     if self.camera:
@@ -135,246 +216,544 @@ class CameraManager:
             return False, None
     
     def release(self):
+        self.is_running = False
+        if self.capture_thread is not None and self.capture_thread is not threading.current_thread():
+            self.capture_thread.join(timeout=2.0)
+            self.capture_thread = None
         with self.lock:
             if self.camera:
                 self.camera.release()
                 self.camera = None
 
-# Initialize camera manager
-camera_manager = CameraManager()
-
 # Face recognition settings
 face_config = config.get('face_recognition', {})
 
-# Load known face encodings
-known_face_encodings = []
-known_face_names = []
+# Hot-path settings come from the active pipeline profile, switchable at runtime
+pipeline_profiles = ProfileManager(config)
+
+# Encodings of face_images/ files, so restarts and reloads only encode new images
+face_image_cache = EncodingCache('database/face_image_encodings.npz')
+
+# Approximate nearest-neighbour index; galleries below min_size are matched exhaustively
+ann_config = face_config.get('ann', {})
+face_index = None
+if ann_config.get('enabled', True):
+    face_index = IVFIndex(nlist=ann_config.get('nlist', 0),
+                          nprobe=ann_config.get('nprobe', 8),
+                          min_size=ann_config.get('min_size', 20000))
+
+# Several samples per person; matching goes through per-person prototypes first
+samples_config = face_config.get('samples', {})
+
+# Known faces; request handlers edit it incrementally, the video loop reads
+# face_gallery.snapshot without locking
+face_gallery = FaceGallery(index=face_index,
+                           max_samples=samples_config.get('max_per_identity', 10),
+                           prototypes=samples_config.get('prototypes', 1),
+                           rerank_margin=samples_config.get('rerank_margin', 0.1))
+
+def file_face_key(path):
+    """Gallery key of a face loaded from face_images/"""
+    return 'file:' + os.path.normpath(path)
+
+def db_face_key(face_id):
+    """Gallery key of a face stored in the faces table"""
+    return f'db:{face_id}'
 
 # Performance optimization variables
-frame_count = 0
 perf_config = config.get('performance', {})
 process_every_n_frames = perf_config.get('process_every_n_frames', 3)
-max_faces_per_frame = perf_config.get('max_faces_per_frame', 5)
-jpeg_quality = perf_config.get('jpeg_quality', 80)
 log_throttle_seconds = perf_config.get('log_throttle_seconds', 5)
+recognition_workers = perf_config.get('recognition_workers')  # None = one per spare CPU core
 last_log_time = {}  # Track last time each person was logged to prevent spam
 
-# Global variables for real-time stats
-current_faces_detected = 0
-current_known_faces_active = 0
+# Request handlers borrow connections instead of opening one per query
+db_pool = ConnectionPool()
+
+# Recognition events are batched into the database by a background thread
+recognition_log_writer = RecognitionLogWriter()
+
+# Rolls raw recognition logs up into hourly/daily summaries and prunes them
+logging_config = config.get('logging', {})
+log_retention_job = LogRetentionJob(interval=logging_config.get('maintenance_interval_seconds', 60),
+                                    max_age_days=logging_config.get('retention_days', 30),
+                                    # Opt-in row cap; the legacy max_log_entries key is not enforced
+                                    max_rows=logging_config.get('max_raw_log_rows'),
+                                    hourly_max_age_days=logging_config.get('hourly_summary_days', 90),
+                                    batch_size=logging_config.get('prune_batch_size', 500))
+
+# Rolling counters behind the live dashboard endpoints
+recognition_stats = RecognitionStats()
+
+# Pushes detections and stat changes to open dashboards over /api/events
+event_hub = EventHub()
+live_events_thread = None
 
 # Capture lock to prevent conflicts
 capture_in_progress = False
 capture_lock = threading.Lock()
 
+# Guards starting the shared pipeline threads
+pipeline_lock = threading.Lock()
+
+# Tracks faces between recognition results so confirmed identities skip re-encoding
+tracking_config = config.get('tracking', {})
+skip_verified_faces = tracking_config.get('skip_verified_faces', True)
+
+# Motion gating: recognition only scans regions that changed
+motion_config = config.get('motion', {})
+
+# MJPEG renditions shared by the viewers of a camera; slow viewers step down to smaller ones
+streaming_config = config.get('streaming', {})
+stream_renditions = streaming_config.get('renditions') or DEFAULT_RENDITIONS
+
+def db_image_paths():
+    """Normalized image paths of the faces stored in the database"""
+    try:
+        with db_pool.connection() as conn:
+            rows = conn.execute("SELECT image_path FROM faces WHERE image_path IS NOT NULL").fetchall()
+    except Exception as e:
+        logger.error(f"Error reading face image paths: {str(e)}")
+        return set()
+    return {os.path.normpath(path) for (path,) in rows}
+
 def load_known_faces():
-    global known_face_encodings, known_face_names
+    """Sync the gallery with the images in face_images/ that are not stored in the database"""
     face_images_dir = "face_images"
     if not os.path.exists(face_images_dir):
         os.makedirs(face_images_dir)
         return
     
-    # Clear existing faces to reload
-    known_face_encodings = []
-    known_face_names = []
-        
-    for filename in os.listdir(face_images_dir):
+    # Images of stored faces are already samples through their database row
+    stored_images = db_image_paths()
+    image_paths = []
+    for filename in sorted(os.listdir(face_images_dir)):
         if filename.endswith((".jpg", ".jpeg", ".png")):
             # Skip debug and full frame images
             if "_debug" in filename or "_full" in filename:
                 continue
-                
             path = os.path.join(face_images_dir, filename)
-            # Clean up the name - remove timestamps and normalize
-            base_name = os.path.splitext(filename)[0]
-            import re
-            name = re.sub(r'_\d{8}_\d{6}$', '', base_name)
-            name = name.replace('_', ' ')  # Replace underscores with spaces
-            
-            try:
-                image = face_recognition.load_image_file(path)
-                encoding = face_recognition.face_encodings(image)
-                if encoding:
-                    known_face_encodings.append(encoding[0])
-                    known_face_names.append(name)
-                    logger.info(f"Loaded face: {name}")
-                else:
-                    logger.warning(f"No face found in {filename} - consider deleting this file")
-            except Exception as e:
-                logger.error(f"Error loading {filename}: {e}")
-
-def init_database():
-    """Initialize the SQLite database"""
-    conn = sqlite3.connect('database/facial_recognition.db')
-    c = conn.cursor()
+            if os.path.normpath(path) not in stored_images:
+                image_paths.append(path)
     
-    # Create faces table
-    c.execute('''CREATE TABLE IF NOT EXISTS faces
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  name TEXT NOT NULL,
-                  encoding TEXT NOT NULL,
-                  image_path TEXT,
-                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    # Only new or changed images are actually encoded
+    encodings = face_image_cache.refresh(image_paths)
     
-    # Create recognition logs table
-    c.execute('''CREATE TABLE IF NOT EXISTS recognition_logs
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  name TEXT NOT NULL,
-                  confidence REAL,
-                  timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                  screenshot TEXT)''')
+    entries = []
+    for path in image_paths:
+        filename = os.path.basename(path)
+        # Clean up the name - remove timestamps and normalize
+        base_name = os.path.splitext(filename)[0]
+        name = re.sub(r'_\d{8}_\d{6}$', '', base_name)
+        name = name.replace('_', ' ')  # Replace underscores with spaces
+        
+        encoding = encodings.get(path)
+        if encoding is None:
+            logger.warning(f"No face found in {filename} - consider deleting this file")
+        else:
+            entries.append((file_face_key(path), name, encoding))
+            logger.debug(f"Loaded face: {name}")
     
-    conn.commit()
-    conn.close()
+    # Only files that were added, changed or removed touch the gallery
+    face_gallery.sync('file:', entries)
+    logger.info(f"Loaded {len(entries)} faces from {face_images_dir}")
 
-def generate_frames():
-    global frame_count, process_every_n_frames, current_faces_detected, current_known_faces_active
+class CameraPipeline:
+    """Capture, tracking, cadence and MJPEG broadcast of one camera.
+
+    Every camera has its own processing thread; all of them share the face
+    gallery, the active pipeline profile and the recognition worker pool,
+    which schedules their frames fairly.
+    """
     
-    # Store face locations and names between frames for smoother display
-    stored_faces = []
+    def __init__(self, camera_id, camera_config, name=None):
+        self.camera_id = camera_id
+        self.name = name or camera_id
+        self.camera_config = camera_config
+        self.camera_manager = CameraManager(camera_config, camera_id)
+        # Recorded media and streams are processed from startup, not only while someone watches
+        self.autostart = camera_config.get('autostart', camera_config.get('source', 'device') != 'device')
+        # One processing thread annotates and encodes frames for all viewers of this camera
+        self.frame_broadcaster = FrameBroadcaster(renditions=stream_renditions,
+                                                  default_rendition=streaming_config.get('default_rendition', 'full'),
+                                                  adaptive=streaming_config.get('adaptive', True),
+                                                  downgrade_lag=streaming_config.get('downgrade_lag', 1.5),
+                                                  upgrade_lag=streaming_config.get('upgrade_lag', 0.3),
+                                                  adapt_seconds=streaming_config.get('adapt_seconds', 3.0))
+        self.face_tracker = FaceTracker(min_confidence=tracking_config.get('min_confidence', 0.65),
+                                        reverify_seconds=tracking_config.get('reverify_seconds', 2.0),
+                                        max_missed=tracking_config.get('max_missed_updates', 2),
+                                        optical_flow=tracking_config.get('optical_flow', True))
+        # Each camera plans its cadence with its fair share of the worker pool
+        self.cadence = AdaptiveCadence(interval=process_every_n_frames,
+                                       min_interval=cadence_config.get('min_interval', 1),
+                                       max_interval=cadence_config.get('max_interval', 15),
+                                       target_fps=cadence_target_fps,
+                                       max_result_age=cadence_config.get('max_result_age_ms', 500) / 1000.0,
+                                       worker_utilization=cadence_config.get('worker_utilization', 0.8),
+                                       workers=recognition_stage.workers / max(1, len(camera_configs)),
+                                       enabled=cadence_config.get('enabled', True))
+        # Gates detection to the parts of the scene that moved
+        self.motion_detector = None
+        if motion_config.get('enabled', False):
+            self.motion_detector = MotionDetector(threshold=motion_config.get('threshold', 25),
+                                                  min_area=motion_config.get('min_area', 0.002),
+                                                  learning_rate=motion_config.get('learning_rate', 0.05),
+                                                  padding=motion_config.get('padding', 0.25),
+                                                  full_scan_seconds=motion_config.get('full_scan_seconds', 10))
+        self.frame_count = 0
+        self.faces_detected = 0
+        self.known_faces_active = 0
+        self.processing_thread = None
     
-    # Frame timing for consistent FPS
-    target_fps = 25  # Target frame rate
-    frame_time = 1.0 / target_fps
-    last_frame_time = time.time()
+    def start(self):
+        """Start capturing and processing; called with pipeline_lock held"""
+        self.camera_manager.start()
+        if self.processing_thread is None:
+            self.processing_thread = threading.Thread(target=self.process_frames,
+                                                      name=f"frame-processing-{self.camera_id}", daemon=True)
+            self.processing_thread.start()
+            logger.info(f"Frame processing thread started for camera '{self.camera_id}'")
     
-    while True:
-        try:
-            success, frame = camera_manager.get_frame()
-            if not success or frame is None:
-                logger.error("Failed to read from camera - camera may not be available")
-                # Create a simple error image
-                error_frame = np.zeros((480, 640, 3), dtype=np.uint8)
-                cv2.putText(error_frame, "Camera Error", (200, 240), cv2.FONT_HERSHEY_SIMPLEX, 2, (0, 0, 255), 3)
-                cv2.putText(error_frame, "Check camera connection", (150, 280), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-                frame = error_frame
-            
-            frame_count += 1
-            
-            # Process face recognition on every Nth frame
-            should_process = frame_count % process_every_n_frames == 0
-            
-            if should_process:
-                try:
-                    # Resize frame for faster face recognition processing
-                    resize_factor = 0.25  # Fixed resize factor
-                    small_frame = cv2.resize(frame, (0, 0), fx=resize_factor, fy=resize_factor)
-                    rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
-                    
-                    # Find faces with simple parameters
-                    face_locations = face_recognition.face_locations(rgb_small_frame, model='hog')
-                    
-                    # Debug: log face detection
-                    if frame_count % 30 == 0:  # Log every 30 frames
-                        logger.info(f"Face detection: found {len(face_locations)} faces, known faces: {len(known_face_encodings)}")
-                    
-                    # Simple face filtering - just limit number
-                    if len(face_locations) > 3:  # Max 3 faces for performance
-                        face_locations = face_locations[:3]
-                    
-                    # Clear stored faces and process new ones
-                    stored_faces = []
-                    
-                    if face_locations:
-                        if known_face_encodings:
-                            face_encodings = face_recognition.face_encodings(rgb_small_frame, face_locations)
-
-                            # Scale back up face locations
-                            scale_factor = int(1 / resize_factor)
-                            face_locations = [(top*scale_factor, right*scale_factor, bottom*scale_factor, left*scale_factor) 
-                                            for (top, right, bottom, left) in face_locations]
-
-                            # Loop through each face in this frame
-                            for (top, right, bottom, left), face_encoding in zip(face_locations, face_encodings):
-                                matches = face_recognition.compare_faces(known_face_encodings, face_encoding, tolerance=0.6)
-                                name = "Unknown"
-                                confidence = 0.0
-
-                                if matches and any(matches):
-                                    face_distances = face_recognition.face_distance(known_face_encodings, face_encoding)
-                                    best_match_index = np.argmin(face_distances)
-                                    if matches[best_match_index]:
-                                        name = known_face_names[best_match_index]
-                                        confidence = 1 - face_distances[best_match_index]
-                                        
-                                        # Only log high-confidence recognitions
-                                        if confidence > 0.65:
-                                            log_recognition_throttled(name, confidence)
-
-                                # Store face info for drawing
-                                stored_faces.append({
-                                    'location': (top, right, bottom, left),
-                                    'name': name,
-                                    'confidence': confidence
-                                })
-                        else:
-                            # Just detect faces without recognition if no known faces
-                            scale_factor = int(1 / resize_factor)
-                            for (top, right, bottom, left) in face_locations:
-                                scaled_location = (top*scale_factor, right*scale_factor, 
-                                               bottom*scale_factor, left*scale_factor)
-                                stored_faces.append({
-                                    'location': scaled_location,
-                                    'name': 'Unknown',
-                                    'confidence': 0.0
-                                })
-                        
-                except Exception as face_error:
-                    logger.error(f"Error in face recognition processing: {str(face_error)}")
-                    stored_faces = []
-
-            # Update global stats based on current frame - only count valid detections
-            valid_faces = [face for face in stored_faces if face.get('confidence', 0) > 0.4 or face['name'] == 'Unknown']
-            current_faces_detected = len(valid_faces)
-            current_known_faces_active = len([face for face in valid_faces if face['name'] != 'Unknown' and face.get('confidence', 0) > 0.5])
-
-            # Draw all stored faces on the current frame
-            for face_info in stored_faces:
-                top, right, bottom, left = face_info['location']
-                name = face_info['name']
-                confidence = face_info['confidence']
-                
-                # Choose color based on recognition
-                if name != "Unknown":
-                    color = (0, 255, 0)  # Green for known faces
-                else:
-                    color = (0, 0, 255)  # Red for unknown faces
-                
-                # Draw rectangle and name
-                cv2.rectangle(frame, (left, top), (right, bottom), color, 2)
-                cv2.rectangle(frame, (left, bottom - 35), (right, bottom), color, cv2.FILLED)
-                
-                # Format text
-                if confidence > 0:
-                    text = f"{name} ({confidence:.2f})"
+    def restart_camera(self):
+        """Reopen the camera, e.g. to fix a black screen"""
+        self.camera_manager.release()
+        camera_reconnects.inc(camera=self.camera_id)
+        time.sleep(1)
+        self.camera_manager = CameraManager(self.camera_config, self.camera_id)
+        with pipeline_lock:
+            if self.processing_thread is not None:
+                self.camera_manager.start()
+    
+    def release(self):
+        self.camera_manager.release()
+    
+    def motion_regions(self, small_frame, resize_factor):
+        """Regions of the downscaled frame worth scanning: motion plus tracked faces; None scans it all"""
+        if self.motion_detector is None:
+            return None
+        start = time.perf_counter()
+        regions = self.motion_detector.regions(small_frame)
+        stage_seconds.observe(time.perf_counter() - start, camera=self.camera_id, stage='motion')
+        if regions is None:
+            return None
+        return regions + [tuple(int(v * resize_factor) for v in face['location']) for face in self.face_tracker.faces()]
+    
+    def handle_recognition_result(self, frame_id, context, face_locations, face_encodings, timings):
+        """Match faces found by a recognition worker and publish them to this camera's stream"""
+        resize_factor = context['resize_factor']
+        profile = context['profile']
+        latency = time.time() - context['submitted_at']
+        self.cadence.record_result(timings, latency)
+        stage_seconds.observe(timings['detect'], camera=self.camera_id, stage='detect')
+        stage_seconds.observe(timings['encode'], camera=self.camera_id, stage='encode')
+        stage_seconds.observe(latency, camera=self.camera_id, stage='recognition_round_trip')
+        
+        # Debug: log face detection
+        if frame_id % 30 == 0:  # Log every 30 frames
+            logger.info(f"Face detection [{self.camera_id}]: found {len(face_locations)} faces, "
+                        f"known faces: {len(face_gallery)}, "
+                        f"detect {timings['detect']*1000:.0f}ms, encode {timings['encode']*1000:.0f}ms")
+        
+        # Scale back up face locations
+        face_locations = [tuple(int(v / resize_factor) for v in location) for location in face_locations]
+        
+        # Faces already identified by the tracker come back without an encoding
+        encoded = [i for i, encoding in enumerate(face_encodings) if encoding is not None]
+        detections = [(location, None, 0.0) for location in face_locations]
+        if encoded:
+            # Match every encoded face in this frame against the current gallery version in one batch
+            start = time.perf_counter()
+            matches = face_gallery.snapshot.best_match([face_encodings[i] for i in encoded], tolerance=profile.tolerance)
+            stage_seconds.observe(time.perf_counter() - start, camera=self.camera_id, stage='match')
+            for i, (name, confidence) in zip(encoded, matches):
+                detections[i] = (face_locations[i], name, confidence)
+                # Only log high-confidence recognitions
+                if confidence > 0.65:
+                    log_recognition_throttled(name, confidence)
+        
+        # Carry identities over to the tracks; faces without an encoding keep their track's name
+        self.face_tracker.update(detections)
+        faces = self.face_tracker.faces()
+        
+        # Update this camera's stats based on current results - only count valid detections
+        valid_faces = [face for face in faces if face.get('confidence', 0) > 0.4 or face['name'] == 'Unknown']
+        self.faces_detected = len(valid_faces)
+        self.known_faces_active = len([face for face in valid_faces if face['name'] != 'Unknown' and face.get('confidence', 0) > 0.5])
+        
+        if event_hub.subscriber_count:
+            event_hub.set_state('stats', live_stats())
+    
+    def encode_renditions(self, frame, renditions, jpeg_quality):
+        """JPEG bytes of the annotated frame for each rendition name"""
+        encoded = {}
+        for name in renditions:
+            settings = self.frame_broadcaster.renditions[name]
+            scale = settings.get('scale', 1.0)
+            image = frame
+            if scale != 1.0:
+                image = cv2.resize(frame, (0, 0), fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            quality = settings.get('jpeg_quality') or jpeg_quality
+            ret, buffer = cv2.imencode('.jpg', image, [int(cv2.IMWRITE_JPEG_QUALITY), int(quality)])
+            if not ret:
+                logger.error(f"Failed to encode {name} frame")
+                continue
+            encoded[name] = buffer.tobytes()
+        return encoded
+    
+    def process_frames(self):
+        """Processing loop: annotate the newest frame of this camera and broadcast it to its viewers"""
+        
+        last_frame_time = time.time()
+        last_seq = 0
+        
+        while True:
+            try:
+                # Settings of the active profile; a switch takes effect from this frame on
+                pipeline_profiles.reload_if_changed()
+                profile = pipeline_profiles.current
+                # The stream is paced at the profile's FPS, so the cadence can only aim below it
+                self.cadence.target_fps = min(cadence_target_fps, 0.8 * profile.target_fps)
+        
+
+                # Always take the newest captured frame; frames older than that are skipped
+                previous_seq = last_seq
+                last_seq, frame = self.camera_manager.wait_for_frame(last_seq)
+                camera_frame = frame is not None
+                if camera_frame:
+                    frames_processed.inc(camera=self.camera_id)
+                    if last_seq > previous_seq + 1:
+                        frames_skipped.inc(last_seq - previous_seq - 1, camera=self.camera_id)
+                    # The captured frame is shared, draw on a private copy
+                    frame = frame.copy()
                 else:
-                    text = name
-                
-                font = cv2.FONT_HERSHEY_DUPLEX
-                cv2.putText(frame, text, (left + 6, bottom - 6), font, 0.6, (255, 255, 255), 1)
+                    logger.error(f"Failed to read from camera '{self.camera_id}' - camera may not be available")
+                    # Create a simple error image
+                    error_frame = np.zeros((480, 640, 3), dtype=np.uint8)
+                    cv2.putText(error_frame, "Camera Error", (200, 240), cv2.FONT_HERSHEY_SIMPLEX, 2, (0, 0, 255), 3)
+                    cv2.putText(error_frame, "Check camera connection", (150, 280), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+                    frame = error_frame
+        
+                self.frame_count += 1
+        
+                # Follow tracked faces between recognition results
+                if camera_frame:
+                    self.face_tracker.predict(frame)
+        
+                # Process face recognition on every Nth frame; N adapts to the measured load
+                should_process = self.cadence.should_process(self.frame_count)
+        
+                if should_process:
+                    try:
+                        # Resize frame for faster face recognition processing
+                        resize_factor = profile.resize_factor
+                        start = time.perf_counter()
+                        small_frame = cv2.resize(frame, (0, 0), fx=resize_factor, fy=resize_factor)
+                        preprocess_time = time.perf_counter() - start
+                        
+                        # Only scan where the scene moved or faces are tracked; static frames skip recognition
+                        regions = self.motion_regions(small_frame, resize_factor)
+                        if regions == []:
+                            frames_static.inc(camera=self.camera_id)
+                        else:
+                            start = time.perf_counter()
+                            rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
+                            stage_seconds.observe(preprocess_time + time.perf_counter() - start,
+                                                  camera=self.camera_id, stage='preprocess')
+                            
+                            # Tracked faces with a recent confident match are detected but not re-encoded
+                            skip_boxes = []
+                            if skip_verified_faces:
+                                skip_boxes = [tuple(int(v * resize_factor) for v in box) for box in self.face_tracker.verified_boxes()]
+                            
+                            # Detection and encoding run in the worker pool; results arrive asynchronously
+                            recognition_stage.submit(self.frame_count, rgb_small_frame,
+                                                     context={'resize_factor': resize_factor, 'submitted_at': time.time(),
+                                                              'profile': profile, 'camera': self.camera_id},
+                                                     encode=len(face_gallery) > 0, skip_boxes=skip_boxes,
+                                                     options={'model': profile.model,
+                                                              'number_of_times_to_upsample': profile.number_of_times_to_upsample,
+                                                              'max_faces': profile.max_faces,
+                                                              'prefilter': profile.prefilter,
+                                                              'regions': regions,
+                                                              # The profile's size range is in full-frame pixels
+                                                              'face_size': (profile.min_face_size * resize_factor,
+                                                                            profile.max_face_size * resize_factor)},
+                                                     source=self.camera_id)
+        
+                    except Exception as face_error:
+                        logger.error(f"Error in face recognition processing: {str(face_error)}")
 
-            # Convert frame to jpg with fast encoding
-            encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), jpeg_quality]
-            ret, buffer = cv2.imencode('.jpg', frame, encode_param)
-            if not ret:
-                logger.error("Failed to encode frame")
+                # Draw the tracked faces on the current frame
+                start = time.perf_counter()
+                draw_faces(frame, self.face_tracker.faces())
+                stage_seconds.observe(time.perf_counter() - start, camera=self.camera_id, stage='draw')
+
+                # Encode once per rendition a viewer is waiting for and share it with all its viewers
+                wanted = self.frame_broadcaster.wanted_renditions()
+                if wanted:
+                    start = time.perf_counter()
+                    encoded = self.encode_renditions(frame, wanted, profile.jpeg_quality)
+                    stage_seconds.observe(time.perf_counter() - start, camera=self.camera_id, stage='jpeg_encode')
+                    if encoded:
+                        self.frame_broadcaster.publish_renditions(encoded)
+        
+                # Frame rate limiting for smooth playback
+                frame_time = 1.0 / profile.target_fps
+                current_time = time.time()
+                elapsed = current_time - last_frame_time
+                if elapsed < frame_time:
+                    time.sleep(frame_time - elapsed)
+                last_frame_time = time.time()
+                self.cadence.record_frame(last_frame_time)
+
+            except Exception as e:
+                logger.error(f"Error in process_frames: {str(e)}")
                 continue
-                
-            frame = buffer.tobytes()
-            
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-            
-            # Frame rate limiting for smooth playback
-            current_time = time.time()
-            elapsed = current_time - last_frame_time
-            if elapsed < frame_time:
-                time.sleep(frame_time - elapsed)
-            last_frame_time = time.time()
 
+def handle_recognition_result(frame_id, context, face_locations, face_encodings, timings):
+    """Route a recognition worker result to the pipeline of the camera it came from"""
+    pipeline = camera_pipelines.get(context['camera'])
+    if pipeline is not None:
+        pipeline.handle_recognition_result(frame_id, context, face_locations, face_encodings, timings)
+
+def start_video_pipeline(pipelines=None):
+    """Start the recognition workers and the capture and processing threads of the cameras (all by default) once"""
+    with pipeline_lock:
+        recognition_log_writer.start()
+        recognition_stage.start()
+        for pipeline in pipelines or camera_pipelines.values():
+            pipeline.start()
+
+def autostart_pipelines():
+    """Start the cameras that run without a viewer (``autostart``, on by default for non-device sources)"""
+    pipelines = [pipeline for pipeline in camera_pipelines.values() if pipeline.autostart]
+    if pipelines:
+        start_video_pipeline(pipelines)
+        logger.info(f"Started {len(pipelines)} camera(s) without waiting for a viewer")
+
+def live_stats():
+    """Dashboard counters, answered from memory"""
+    return {
+        'known_faces': face_gallery.snapshot.name_count(),
+        'faces_detected': sum(pipeline.faces_detected for pipeline in camera_pipelines.values()),
+        'recognition_rate': round(recognition_stats.recognition_rate(), 1)
+    }
+
+def live_detections():
+    """Recent detections (last 30 seconds) and confident faces of the last 10 seconds"""
+    return {
+        'recent_detections': recognition_stats.recent_detections(),
+        'active_faces': recognition_stats.active_faces()
+    }
+
+def publish_live_state():
+    """Push the dashboard state to subscribers; unchanged state is not sent again"""
+    event_hub.set_state('stats', live_stats())
+    event_hub.set_state('live', live_detections())
+
+def live_events_loop():
+    """Publish state that changes without a new event, e.g. detections ageing out"""
+    while True:
+        try:
+            if event_hub.subscriber_count:
+                publish_live_state()
         except Exception as e:
-            logger.error(f"Error in generate_frames: {str(e)}")
+            logger.error(f"Error publishing live events: {str(e)}")
+        time.sleep(1.0)
+
+def start_live_events():
+    global live_events_thread
+    with pipeline_lock:
+        if live_events_thread is None:
+            live_events_thread = threading.Thread(target=live_events_loop, name="live-events", daemon=True)
+            live_events_thread.start()
+
+def generate_frames(camera_id, rendition=None):
+    """MJPEG stream for one viewer, fed from the camera's shared broadcaster.
+
+    rendition pins one of the configured renditions; None adapts it to the
+    viewer's throughput.
+    """
+    start_video_pipeline()
+    return camera_pipelines[camera_id].frame_broadcaster.subscribe(rendition)
+
+# Detection and encoding run in worker processes so they never stall the stream
+recognition_stage = RecognitionStage(on_result=handle_recognition_result,
+                                     workers=recognition_workers,
+                                     model=pipeline_profiles.current.model,
+                                     max_faces=pipeline_profiles.current.max_faces,
+                                     prefilter_settings={key: value for key, value in face_config.get('prefilter', {}).items()
+                                                         if key != 'enabled'})
+
+# Processing interval, adjusted at runtime from measured stream FPS and recognition latency
+cadence_config = perf_config.get('adaptive_cadence', {})
+cadence_target_fps = cadence_config.get('target_stream_fps', 20)
+
+def load_camera_configs():
+    """Configured streams as (camera_id, name, settings).
+
+    Each entry of the ``cameras`` list is layered over the ``camera`` section;
+    without a list there is a single camera with the id 'default'.
+    """
+    base = config.get('camera', {})
+    entries = config.get('cameras') or [{'id': 'default'}]
+    cameras = []
+    for i, entry in enumerate(entries):
+        camera_id = str(entry.get('id', i))
+        if not re.fullmatch(r'[A-Za-z0-9_-]+', camera_id) or camera_id in [c[0] for c in cameras]:
+            logger.error(f"Skipping camera with invalid or duplicate id '{camera_id}'")
             continue
+        settings = dict(base, **{key: value for key, value in entry.items() if key not in ('id', 'name')})
+        cameras.append((camera_id, entry.get('name', camera_id), settings))
+    return cameras
+
+# One pipeline per configured camera, in configuration order; the first one is the default feed
+camera_configs = load_camera_configs()
+camera_pipelines = {camera_id: CameraPipeline(camera_id, settings, name)
+                    for camera_id, name, settings in camera_configs}
+default_camera_id = next(iter(camera_pipelines))
+
+def get_camera_pipeline(camera_id=None):
+    """Pipeline of camera_id (the default camera when None); raises KeyError for unknown cameras"""
+    return camera_pipelines[default_camera_id if camera_id is None else camera_id]
+
+def recognition_frame_counts():
+    return {(camera_id, result): count for camera_id, counts in list(recognition_stage.source_stats.items())
+            for result, count in counts.items()}
+
+metrics_registry.gauge('facerec_recognition_frames_total',
+                       "Frames submitted to, completed by and dropped from the recognition workers",
+                       ('camera', 'result'), collect=recognition_frame_counts, kind='counter')
+metrics_registry.gauge('facerec_viewers', "Open /video_feed streams per rendition", ('camera', 'rendition'),
+                       collect=lambda: {(camera_id, rendition): count
+                                        for camera_id, pipeline in camera_pipelines.items()
+                                        for rendition, count in pipeline.frame_broadcaster.viewer_counts().items()})
+metrics_registry.gauge('facerec_viewer_frames_skipped_total', "Frames skipped for viewers that could not keep up",
+                       ('camera',), kind='counter',
+                       collect=lambda: {(camera_id,): pipeline.frame_broadcaster.frames_skipped
+                                        for camera_id, pipeline in camera_pipelines.items()})
+metrics_registry.gauge('facerec_viewer_rendition_switches_total', "Automatic rendition changes of adaptive viewers",
+                       ('camera',), kind='counter',
+                       collect=lambda: {(camera_id,): pipeline.frame_broadcaster.rendition_switches
+                                        for camera_id, pipeline in camera_pipelines.items()})
+metrics_registry.gauge('facerec_process_every_n_frames', "Current recognition cadence", ('camera',),
+                       collect=lambda: {(camera_id,): pipeline.cadence.interval
+                                        for camera_id, pipeline in camera_pipelines.items()})
+metrics_registry.gauge('facerec_faces_detected', "Faces in the latest recognition result", ('camera',),
+                       collect=lambda: {(camera_id,): pipeline.faces_detected
+                                        for camera_id, pipeline in camera_pipelines.items()})
+metrics_registry.gauge('facerec_recognition_workers', "Recognition worker processes",
+                       collect=lambda: recognition_stage.workers)
+metrics_registry.gauge('facerec_log_queue_depth', "Recognition events waiting for the database writer",
+                       collect=lambda: recognition_log_writer.queue.qsize())
+metrics_registry.gauge('facerec_log_events_dropped_total', "Recognition events dropped because the writer queue was full",
+                       collect=lambda: recognition_log_writer.dropped, kind='counter')
+metrics_registry.gauge('facerec_gallery_entries', "Encodings in the face gallery", collect=lambda: len(face_gallery))
+metrics_registry.gauge('facerec_gallery_identities', "Distinct people in the face gallery",
+                       collect=lambda: face_gallery.snapshot.name_count())
+metrics_registry.gauge('facerec_event_subscribers', "Open /api/events streams",
+                       collect=lambda: event_hub.subscriber_count)
 
 def log_recognition_throttled(name, confidence):
     """Log face recognition event to database with throttling to prevent spam"""
@@ -385,17 +764,14 @@ def log_recognition_throttled(name, confidence):
     # Only log if we haven't logged this person recently (more aggressive throttling)
     throttle_time = max(log_throttle_seconds, 3)  # Minimum 3 seconds between logs
     if name not in last_log_time or (current_time - last_log_time[name]) > throttle_time:
-        try:
-            conn = sqlite3.connect('database/facial_recognition.db', timeout=1.0)
-            c = conn.cursor()
-            c.execute("INSERT INTO recognition_logs (name, confidence) VALUES (?, ?)", 
-                      (name, confidence))
-            conn.commit()
-            conn.close()
+        # Queued for the background writer - the video path never waits on the database
+        if recognition_log_writer.log(name, confidence):
             last_log_time[name] = current_time
+            timestamp = recognition_stats.record(name, confidence, current_time)
+            if event_hub.subscriber_count:
+                event_hub.publish('detection', {'name': name, 'confidence': confidence, 'timestamp': timestamp})
+                publish_live_state()
             logger.debug(f"Logged recognition: {name} ({confidence:.2f})")
-        except Exception as e:
-            logger.error(f"Error logging recognition: {str(e)}")
 
 def log_recognition(name, confidence):
     """Legacy function - redirect to throttled version"""
@@ -404,124 +780,244 @@ def log_recognition(name, confidence):
 def load_faces_from_db():
     """Load face encodings from database"""
     try:
-        conn = sqlite3.connect('database/facial_recognition.db')
-        c = conn.cursor()
-        c.execute("SELECT name, encoding FROM faces")
-        for row in c.fetchall():
-            name, encoding_str = row
-            encoding = np.array(json.loads(encoding_str))
-            known_face_encodings.append(encoding)
-            known_face_names.append(name)
-        conn.close()
-        logger.info(f"Loaded {len(known_face_names)} faces from database")
+        with db_pool.connection() as conn:
+            ids, names, encodings = load_face_encodings(conn)
+        logger.info(f"Loaded {len(names)} faces from database")
     except Exception as e:
         logger.error(f"Error loading faces from database: {str(e)}")
+        return
     
-    # Clean up known faces list to remove duplicates
-    unique_names = set()
-    clean_encodings = []
-    clean_names = []
-    
-    for encoding, name in zip(known_face_encodings, known_face_names):
-        if name not in unique_names:
-            unique_names.add(name)
-            clean_encodings.append(encoding)
-            clean_names.append(name)
-    
-    known_face_encodings[:] = clean_encodings
-    known_face_names[:] = clean_names
-    logger.info(f"Total unique faces loaded: {len(known_face_names)}")
+    # Every stored face is a sample of its person; the gallery keeps the newest ones
+    face_gallery.add_many([(db_face_key(face_id), name, encoding)
+                           for face_id, name, encoding in zip(ids, names, encodings)])
+    logger.info(f"Gallery holds {len(face_gallery)} samples of {face_gallery.snapshot.name_count()} people")
+
+def load_recent_recognitions():
+    """Seed the live counters with the last hour of logged recognitions"""
+    try:
+        with db_pool.connection() as conn:
+            c = conn.cursor()
+            c.execute("""SELECT name, confidence, CAST(strftime('%s', timestamp) AS INTEGER)
+                         FROM recognition_logs
+                         WHERE timestamp > datetime('now', '-1 hour')
+                         ORDER BY timestamp""")
+            events = c.fetchall()
+        recognition_stats.seed(events)
+        logger.info(f"Loaded {len(events)} recent recognitions into live stats")
+    except Exception as e:
+        logger.error(f"Error loading recent recognitions: {str(e)}")
 
 @app.route('/')
 def index():
-    return render_template('index.html')
+    return render_template('index.html', cameras=list(camera_pipelines.values()), renditions=list(stream_renditions))
+
+# Sort orders offered on the admin page
+ADMIN_SORT_ORDERS = {
+    'newest': "f.created_at DESC, f.id DESC",
+    'oldest': "f.created_at ASC, f.id ASC",
+    'name': "f.name COLLATE NOCASE ASC, f.id ASC",
+    'recognitions': "(SELECT TOTAL(h.count) FROM recognition_hourly h WHERE h.name = f.name "
+                    "AND h.hour >= strftime('%Y-%m-%d %H:00:00', 'now', '-7 days')) DESC, f.id DESC",
+}
 
 @app.route('/admin')
 def admin():
-    """Admin page for managing faces"""
+    """Admin page for managing faces, one page of the face list at a time"""
+    per_page = config.get('ui', {}).get('admin_page_size', 48)
+    page = max(request.args.get('page', 1, type=int), 1)
+    search = request.args.get('q', '').strip()
+    sort = request.args.get('sort', 'newest')
+    if sort not in ADMIN_SORT_ORDERS:
+        sort = 'newest'
+    pagination = {'page': page, 'pages': 1, 'total': 0, 'per_page': per_page, 'q': search, 'sort': sort}
+    
     try:
-        conn = sqlite3.connect('database/facial_recognition.db', timeout=2.0)
-        c = conn.cursor()
-        c.execute("SELECT id, name, image_path, created_at FROM faces ORDER BY created_at DESC")
-        faces = c.fetchall()
+        with db_pool.connection() as conn:
+            c = conn.cursor()
+            where = ""
+            params = []
+            if search:
+                where = "WHERE f.name LIKE ? ESCAPE '\\'"
+                params.append('%' + re.sub(r'([\\%_])', r'\\\1', search) + '%')
+            
+            c.execute(f"SELECT COUNT(*) FROM faces f {where}", params)
+            total = c.fetchone()[0]
+            pages = max((total + per_page - 1) // per_page, 1)
+            page = min(page, pages)
+            pagination.update(page=page, pages=pages, total=total)
+            
+            c.execute(f"""SELECT f.id, f.name, f.image_path, f.created_at FROM faces f {where}
+                          ORDER BY {ADMIN_SORT_ORDERS[sort]} LIMIT ? OFFSET ?""",
+                      params + [per_page, (page - 1) * per_page])
+            faces = c.fetchall()
+            
+            # 7-day recognition stats for every name on this page, from the hourly summaries
+            names = sorted({face[1] for face in faces})
+            name_stats = {}
+            if names:
+                c.execute(f"""SELECT name, SUM(count), SUM(confidence_sum) / SUM(count), MAX(last_seen)
+                              FROM recognition_hourly
+                              WHERE name IN ({','.join('?' * len(names))})
+                              AND hour >= strftime('%Y-%m-%d %H:00:00', 'now', '-7 days')
+                              GROUP BY name""", names)
+                name_stats = {row[0]: row[1:] for row in c.fetchall()}
         
-        # Get recognition stats for each face
         face_stats = {}
-        for face in faces:
-            face_id, name = face[0], face[1]
-            c.execute("""SELECT COUNT(*), AVG(confidence), MAX(timestamp) 
-                        FROM recognition_logs 
-                        WHERE name = ? AND timestamp > datetime('now', '-7 days')""", (name,))
-            stats = c.fetchone()
+        for face_id, name, _, _ in faces:
+            count, avg_confidence, last_seen = name_stats.get(name, (0, None, None))
             face_stats[face_id] = {
-                'recognitions': stats[0] or 0,
-                'avg_confidence': stats[1] or 0,
-                'last_seen': stats[2] or 'Never'
+                'recognitions': count or 0,
+                'avg_confidence': avg_confidence or 0,
+                'last_seen': last_seen or 'Never'
             }
         
-        conn.close()
-        
-        return render_template('admin.html', faces=faces, face_stats=face_stats)
+        return render_template('admin.html', faces=faces, face_stats=face_stats, pagination=pagination)
         
     except Exception as e:
         logger.error(f"Error loading admin page: {str(e)}")
-        return render_template('admin.html', faces=[], face_stats={}, error=str(e))
+        return render_template('admin.html', faces=[], face_stats={}, pagination=pagination, error=str(e))
 
 @app.route('/logs')
 def logs():
-    """View recognition logs"""
-    conn = sqlite3.connect('database/facial_recognition.db')
-    c = conn.cursor()
-    c.execute("""SELECT name, confidence, timestamp 
-                 FROM recognition_logs 
-                 ORDER BY timestamp DESC 
-                 LIMIT 100""")
-    logs = c.fetchall()
-    conn.close()
-    return render_template('logs.html', logs=logs)
+    """View recognition logs; older pages are loaded through /api/logs"""
+    with db_pool.connection() as conn:
+        rows, next_cursor = query_recognition_logs(conn, limit=100)
+    logs = [(name, confidence, timestamp) for _, name, confidence, timestamp in rows]
+    return render_template('logs.html', logs=logs, next_cursor=next_cursor)
+
+# Confidence levels offered by the logs page filter: (exclusive min, inclusive max)
+CONFIDENCE_LEVELS = {
+    'high': (0.8, None),
+    'medium': (0.5, 0.8),
+    'low': (None, 0.5),
+}
+
+def log_filter_from_request():
+    """Translate query parameters into a recognition_logs filter; raises ValueError on bad input"""
+    args = request.args
+    min_confidence = args.get('min_confidence', type=float)
+    max_confidence = args.get('max_confidence', type=float)
+    level = args.get('confidence')
+    if level:
+        if level not in CONFIDENCE_LEVELS:
+            raise ValueError(f"Unknown confidence level: {level}")
+        min_confidence, max_confidence = CONFIDENCE_LEVELS[level]
+    return recognition_log_filter(name=args.get('name'),
+                                  search=args.get('q'),
+                                  min_confidence=min_confidence,
+                                  max_confidence=max_confidence,
+                                  since=args.get('since'),
+                                  until=args.get('until'),
+                                  period=args.get('period'))
+
+@app.route('/api/logs')
+def get_logs():
+    """Filtered recognition logs, newest first, paginated with an opaque cursor"""
+    try:
+        where, params = log_filter_from_request()
+        limit = min(max(request.args.get('limit', 100, type=int), 1), 1000)
+        with db_pool.connection() as conn:
+            rows, next_cursor = query_recognition_logs(conn, where, params, limit=limit,
+                                                       cursor=request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error querying logs: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+    
+    return jsonify({
+        'logs': [{'id': log_id, 'name': name, 'confidence': confidence, 'timestamp': timestamp}
+                 for log_id, name, confidence, timestamp in rows],
+        'next_cursor': next_cursor
+    })
+
+@app.route('/api/logs/export')
+def export_logs():
+    """Stream every log matching the filters as CSV"""
+    try:
+        where, params = log_filter_from_request()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    def generate():
+        # A dedicated connection: an export can outlive any request using the pool
+        conn = connect()
+        try:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(['id', 'name', 'confidence', 'timestamp'])
+            for rows in iter_recognition_logs(conn, where, params):
+                writer.writerows(rows)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            yield buffer.getvalue()
+        except Exception as e:
+            logger.error(f"Error exporting logs: {str(e)}")
+        finally:
+            conn.close()
+    
+    filename = f"face_recognition_logs_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    return Response(generate(), mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+def feed_rendition():
+    """Rendition requested with ?quality= (None for auto); raises ValueError for unknown names"""
+    quality = request.args.get('quality', 'auto')
+    if quality == 'auto':
+        return None
+    if quality not in stream_renditions:
+        raise ValueError(f"Unknown quality '{quality}', expected auto or one of {', '.join(stream_renditions)}")
+    return quality
 
 @app.route('/video_feed')
 def video_feed():
-    return Response(generate_frames(),
+    return camera_feed(default_camera_id)
+
+@app.route('/video_feed/<camera_id>')
+def camera_feed(camera_id):
+    if camera_id not in camera_pipelines:
+        return jsonify({'success': False, 'error': 'Unknown camera'}), 404
+    try:
+        rendition = feed_rendition()
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return Response(generate_frames(camera_id, rendition),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape endpoint; ?format=json returns the same metrics as JSON"""
+    if request.args.get('format') == 'json':
+        return jsonify(metrics_registry.as_dict())
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/api/cameras')
+def get_cameras():
+    """Configured cameras with their live state"""
+    return jsonify({'cameras': [camera_summary(pipeline) for pipeline in camera_pipelines.values()],
+                    'default': default_camera_id})
+
+def camera_summary(pipeline):
+    source = pipeline.camera_manager.camera
+    return {
+        'id': pipeline.camera_id,
+        'name': pipeline.name,
+        'source': source.description if source is not None else None,
+        'running': pipeline.camera_manager.is_running,
+        'viewers': pipeline.frame_broadcaster.subscriber_count,
+        'streams': pipeline.frame_broadcaster.viewer_stats(),
+        'faces_detected': pipeline.faces_detected,
+        'known_faces_active': pipeline.known_faces_active
+    }
+
 @app.route('/api/stats')
 def get_stats():
-    """Get current statistics"""
+    """Get current statistics from the in-memory counters"""
     try:
-        conn = sqlite3.connect('database/facial_recognition.db', timeout=2.0)
-        c = conn.cursor()
-        
-        # Get total known faces
-        c.execute("SELECT COUNT(DISTINCT name) FROM faces")
-        result = c.fetchone()
-        known_faces = result[0] if result else 0
-        
-        # Use real-time face detection data from the video stream
-        global current_faces_detected
-        faces_currently_detected = current_faces_detected
-        
-        # Calculate recognition rate from last hour (lowered threshold)
-        c.execute("""SELECT 
-                     COUNT(CASE WHEN confidence > 0.5 THEN 1 END) as high_conf,
-                     COUNT(*) as total
-                     FROM recognition_logs 
-                     WHERE timestamp > datetime('now', '-1 hour')""")
-        result = c.fetchone()
-        
-        if result and result[1] > 0:
-            recognition_rate = (result[0] * 100.0) / result[1]
-        else:
-            recognition_rate = 0
-        
-        conn.close()
-        
-        # Ensure all values are numbers and not None
-        return jsonify({
-            'known_faces': int(known_faces or 0),
-            'faces_detected': int(faces_currently_detected or 0),
-            'recognition_rate': round(float(recognition_rate or 0), 1)
-        })
+        stats = live_stats()
+        stats['pipeline'] = get_pipeline_stats()
+        return jsonify(stats)
         
     except Exception as e:
         logger.error(f"Error getting stats: {str(e)}")
@@ -531,43 +1027,31 @@ def get_stats():
             'recognition_rate': 0.0
         }), 200
 
+def get_pipeline_stats():
+    """Current processing cadence and measured recognition costs, per camera"""
+    cameras = {}
+    for camera_id, pipeline in camera_pipelines.items():
+        camera_stats = pipeline.cadence.stats()
+        camera_stats.update(recognition_stage.source_stats.get(camera_id, {}))
+        cameras[camera_id] = camera_stats
+    stats = {
+        'cameras': cameras,
+        'workers': recognition_stage.workers,
+        'frames_submitted': recognition_stage.frames_submitted,
+        'frames_completed': recognition_stage.frames_completed,
+        'frames_dropped': recognition_stage.frames_dropped,
+        'log_queue_depth': recognition_log_writer.queue.qsize(),
+        'log_events_dropped': recognition_log_writer.dropped
+    }
+    return stats
+
 @app.route('/api/recent_detections')
 def get_recent_detections():
     """Get recent face detections for live updates"""
     try:
-        conn = sqlite3.connect('database/facial_recognition.db', timeout=2.0)
-        c = conn.cursor()
-        
-        # Get recent detections (last 30 seconds)
-        c.execute("""SELECT name, confidence, timestamp 
-                     FROM recognition_logs 
-                     WHERE timestamp > datetime('now', '-30 seconds')
-                     ORDER BY timestamp DESC 
-                     LIMIT 10""")
-        recent = c.fetchall()
-        
-        # Get current active faces (last 10 seconds) with better confidence filtering
-        c.execute("""SELECT name, MAX(confidence) as max_conf, COUNT(*) as count
-                     FROM recognition_logs 
-                     WHERE timestamp > datetime('now', '-10 seconds')
-                     AND confidence > 0.6
-                     GROUP BY name
-                     ORDER BY MAX(confidence) DESC""")
-        active = c.fetchall()
-        
-        # Use real-time data if available
-        global current_known_faces_active
-        if current_known_faces_active > len(active):
-            # Supplement with current real-time data
-            active = active[:current_known_faces_active]
-        
-        conn.close()
-        
-        return jsonify({
-            'recent_detections': recent,
-            'active_faces': active,
-            'timestamp': datetime.now().isoformat()
-        })
+        data = live_detections()
+        data['timestamp'] = datetime.now().isoformat()
+        return jsonify(data)
         
     except Exception as e:
         logger.error(f"Error getting recent detections: {str(e)}")
@@ -577,18 +1061,28 @@ def get_recent_detections():
             'timestamp': datetime.now().isoformat()
         }), 200
 
+@app.route('/api/events')
+def event_stream():
+    """Server-Sent Events: 'detection' per logged recognition, 'stats' and 'live' whenever they change"""
+    start_live_events()
+    publish_live_state()
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    response = Response(event_hub.subscribe(last_event_id), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @app.route('/api/recent_logs')
 def get_recent_logs():
     """Get recent logs for auto-refresh"""
     try:
-        conn = sqlite3.connect('database/facial_recognition.db', timeout=2.0)
-        c = conn.cursor()
-        c.execute("""SELECT name, confidence, timestamp 
-                     FROM recognition_logs 
-                     ORDER BY timestamp DESC 
-                     LIMIT 50""")
-        logs = c.fetchall()
-        conn.close()
+        with db_pool.connection() as conn:
+            c = conn.cursor()
+            c.execute("""SELECT name, confidence, timestamp 
+                         FROM recognition_logs 
+                         ORDER BY timestamp DESC 
+                         LIMIT 50""")
+            logs = c.fetchall()
         
         # Convert to format expected by frontend
         formatted_logs = []
@@ -626,25 +1120,21 @@ def serve_static_files(filename):
 
 @app.route('/api/admin_stats')
 def get_admin_stats():
-    """Get admin dashboard statistics"""
+    """Get admin dashboard statistics from the recognition summaries"""
     try:
-        conn = sqlite3.connect('database/facial_recognition.db', timeout=2.0)
-        c = conn.cursor()
-        
-        # Active today (recognized in last 24 hours)
-        c.execute("""SELECT COUNT(DISTINCT name) FROM recognition_logs 
-                     WHERE timestamp > datetime('now', '-1 day')""")
-        active_today = c.fetchone()[0] or 0
-        
-        # Total recognitions
-        c.execute("SELECT COUNT(*) FROM recognition_logs")
-        total_recognitions = c.fetchone()[0] or 0
+        with db_pool.connection() as conn:
+            c = conn.cursor()
         
-        # Average confidence
-        c.execute("SELECT AVG(confidence) FROM recognition_logs WHERE confidence > 0")
-        avg_confidence = c.fetchone()[0] or 0
+            # Active today (recognized in the last 24 hours, to the hour)
+            c.execute("""SELECT COUNT(DISTINCT name) FROM recognition_hourly 
+                         WHERE hour >= strftime('%Y-%m-%d %H:00:00', 'now', '-1 day')""")
+            active_today = c.fetchone()[0] or 0
         
-        conn.close()
+            # Total recognitions and average confidence over the whole history
+            c.execute("SELECT SUM(count), SUM(confidence_sum) / SUM(count) FROM recognition_daily")
+            total_recognitions, avg_confidence = c.fetchone()
+            total_recognitions = total_recognitions or 0
+            avg_confidence = avg_confidence or 0
         
         return jsonify({
             'active_today': active_today,
@@ -660,6 +1150,40 @@ def get_admin_stats():
             'avg_confidence': 0
         }), 200
 
+@app.route('/api/profiles', methods=['GET'])
+def get_profiles():
+    """List the pipeline profiles and the active one"""
+    return jsonify(pipeline_profiles.as_dict())
+
+@app.route('/api/profiles/active', methods=['POST'])
+def activate_profile():
+    """Switch the running pipeline to another profile"""
+    name = (request.json or {}).get('name', '')
+    try:
+        profile = pipeline_profiles.activate(name)
+    except KeyError:
+        return jsonify({'success': False, 'error': f"Unknown profile '{name}'"}), 404
+    return jsonify({'success': True, 'active': profile.name, 'profile': profile.as_dict()})
+
+@app.route('/api/profiles/<name>', methods=['PUT', 'PATCH'])
+def update_profile(name):
+    """Create a profile or change some of its settings; applies at once if it is active"""
+    try:
+        profile = pipeline_profiles.update(name, request.json or {})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({'success': True, 'name': name, 'profile': profile})
+
+@app.route('/api/profiles/<name>', methods=['DELETE'])
+def delete_profile(name):
+    try:
+        pipeline_profiles.delete(name)
+    except KeyError:
+        return jsonify({'success': False, 'error': f"Unknown profile '{name}'"}), 404
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({'success': True})
+
 @app.route('/rename_face/<int:face_id>', methods=['POST'])
 def rename_face(face_id):
     """Rename a face"""
@@ -670,31 +1194,29 @@ def rename_face(face_id):
         if not new_name:
             return jsonify({'success': False, 'error': 'Name is required'}), 400
         
-        conn = sqlite3.connect('database/facial_recognition.db', timeout=5.0)
-        c = conn.cursor()
+        with db_pool.connection() as conn:
+            c = conn.cursor()
         
-        # Get old name
-        c.execute("SELECT name FROM faces WHERE id = ?", (face_id,))
-        result = c.fetchone()
-        if not result:
-            return jsonify({'success': False, 'error': 'Face not found'}), 404
+            # Get old name
+            c.execute("SELECT name FROM faces WHERE id = ?", (face_id,))
+            result = c.fetchone()
+            if not result:
+                return jsonify({'success': False, 'error': 'Face not found'}), 404
         
-        old_name = result[0]
+            old_name = result[0]
         
-        # Update face name
-        c.execute("UPDATE faces SET name = ? WHERE id = ?", (new_name, face_id))
+            # Renaming renames the person: every stored sample, like the in-memory gallery
+            c.execute("UPDATE faces SET name = ? WHERE name = ?", (new_name, old_name))
         
-        # Update recognition logs
-        c.execute("UPDATE recognition_logs SET name = ? WHERE name = ?", (new_name, old_name))
+            # Update recognition logs and their summaries
+            c.execute("UPDATE recognition_logs SET name = ? WHERE name = ?", (new_name, old_name))
+            rename_identity_rollups(conn, old_name, new_name)
         
-        conn.commit()
-        conn.close()
+            conn.commit()
         
         # Update known faces in memory
-        global known_face_names
-        for i, name in enumerate(known_face_names):
-            if name == old_name:
-                known_face_names[i] = new_name
+        face_gallery.rename(old_name, new_name)
+        recognition_stats.rename(old_name, new_name)
         
         return jsonify({'success': True, 'message': f'Renamed {old_name} to {new_name}'})
         
@@ -712,43 +1234,45 @@ def bulk_delete_faces():
         if not face_ids:
             return jsonify({'success': False, 'error': 'No faces selected'}), 400
         
-        conn = sqlite3.connect('database/facial_recognition.db', timeout=5.0)
-        c = conn.cursor()
+        with db_pool.connection() as conn:
+            c = conn.cursor()
         
-        deleted_names = []
+            deleted_names = []
+            removed_keys = []
         
-        for face_id in face_ids:
-            # Get face info
-            c.execute("SELECT name, image_path FROM faces WHERE id = ?", (face_id,))
-            result = c.fetchone()
+            for face_id in face_ids:
+                # Get face info
+                c.execute("SELECT name, image_path FROM faces WHERE id = ?", (face_id,))
+                result = c.fetchone()
             
-            if result:
-                name, image_path = result
-                deleted_names.append(name)
+                if result:
+                    name, image_path = result
+                    deleted_names.append(name)
+                    removed_keys.append(db_face_key(face_id))
+                    if image_path:
+                        removed_keys.append(file_face_key(image_path))
                 
-                # Delete image file
-                if image_path and os.path.exists(image_path):
-                    os.remove(image_path)
+                    # Delete image file
+                    if image_path and os.path.exists(image_path):
+                        os.remove(image_path)
                 
-                # Delete from database
-                c.execute("DELETE FROM faces WHERE id = ?", (face_id,))
-                c.execute("DELETE FROM recognition_logs WHERE name = ?", (name,))
-        
-        conn.commit()
-        conn.close()
-        
-        # Update known faces in memory
-        global known_face_encodings, known_face_names
-        new_encodings = []
-        new_names = []
+                    # Delete from database
+                    c.execute("DELETE FROM faces WHERE id = ?", (face_id,))
+        
+            # History only goes with the last sample of a person
+            forgotten_names = []
+            for name in dict.fromkeys(deleted_names):
+                c.execute("SELECT 1 FROM faces WHERE name = ? LIMIT 1", (name,))
+                if c.fetchone() is None:
+                    forgotten_names.append(name)
+                    c.execute("DELETE FROM recognition_logs WHERE name = ?", (name,))
+                    delete_identity_rollups(conn, name)
         
-        for i, name in enumerate(known_face_names):
-            if name not in deleted_names:
-                new_encodings.append(known_face_encodings[i])
-                new_names.append(name)
+            conn.commit()
         
-        known_face_encodings = new_encodings
-        known_face_names = new_names
+        # Drop only the deleted samples; other samples of the same people stay
+        face_gallery.remove(removed_keys)
+        recognition_stats.forget(forgotten_names)
         
         return jsonify({'success': True, 'message': f'Deleted {len(face_ids)} faces'})
         
@@ -778,6 +1302,12 @@ def capture_face():
         logger.warning("Empty name provided")
         return jsonify({'success': False, 'error': 'Name is required'}), 400
     
+    # Capture from the camera the user is watching
+    camera_id = data.get('camera_id') or None
+    if camera_id is not None and camera_id not in camera_pipelines:
+        return jsonify({'success': False, 'error': 'Unknown camera'}), 404
+    camera_manager = get_camera_pipeline(camera_id).camera_manager
+    
     # Check if another capture is in progress
     with capture_lock:
         if capture_in_progress:
@@ -935,14 +1465,15 @@ def capture_face():
         
         # Save to database with error handling
         conn = None
+        face_id = None
         try:
             logger.info("Connecting to database...")
-            conn = sqlite3.connect('database/facial_recognition.db', timeout=10.0)
+            conn = db_pool.acquire()
             c = conn.cursor()
             
-            # Convert encoding to string safely
+            # Convert encoding to a float32 blob safely
             try:
-                encoding_str = json.dumps(face_encoding.tolist())
+                encoding_blob = encoding_to_blob(face_encoding)
                 logger.info("Face encoding serialized successfully")
             except Exception as e:
                 logger.error(f"Failed to serialize face encoding: {e}")
@@ -951,7 +1482,8 @@ def capture_face():
             # Insert into database
             logger.info("Inserting face into database...")
             c.execute("INSERT INTO faces (name, encoding, image_path) VALUES (?, ?, ?)",
-                      (name, encoding_str, filepath))
+                      (name, encoding_blob, filepath))
+            face_id = c.lastrowid
             conn.commit()
             logger.info("Database insert successful")
             
@@ -980,14 +1512,11 @@ def capture_face():
             return jsonify({'success': False, 'error': f'Failed to save to database: {str(e)}'}), 500
         finally:
             if conn:
-                conn.close()
-                logger.info("Database connection closed")
+                db_pool.release(conn)
         
         # Update known faces in memory safely
         try:
-            global known_face_encodings, known_face_names
-            known_face_encodings.append(face_encoding)
-            known_face_names.append(name)
+            face_gallery.add(db_face_key(face_id), name, face_encoding)
             logger.info(f"Updated in-memory face data for {name}")
         except Exception as e:
             logger.warning(f"Failed to update in-memory data: {e}")
@@ -995,15 +1524,12 @@ def capture_face():
         
         logger.info(f"Successfully completed face capture for {name}")
         
-        # Reload faces to include the new one
-        load_known_faces()
-        
         # Return the image path so it can be displayed
         response = jsonify({
             'success': True, 
             'message': f'Face captured and saved for {name}!',
             'image_path': filepath,
-            'face_id': conn.lastrowid if conn else None
+            'face_id': face_id
         })
         
         # Add CORS headers to prevent network errors
@@ -1039,15 +1565,17 @@ def test_image(filename):
 def restart_camera():
     """Restart camera connection to fix black screen issues"""
     try:
-        global camera_manager
-        logger.info("Restarting camera...")
-        camera_manager.release()
-        time.sleep(1)
-        camera_manager = CameraManager()
+        data = request.get_json(silent=True) or {}
+        camera_id = data.get('camera_id') or request.args.get('camera_id') or None
+        if camera_id is not None and camera_id not in camera_pipelines:
+            return jsonify({'success': False, 'error': 'Unknown camera'}), 404
+        pipeline = get_camera_pipeline(camera_id)
+        logger.info(f"Restarting camera '{pipeline.camera_id}'...")
+        pipeline.restart_camera()
         time.sleep(0.5)
         
         # Test if camera works
-        success, frame = camera_manager.get_frame()
+        success, frame = pipeline.camera_manager.get_frame()
         if success and frame is not None:
             return jsonify({'success': True, 'message': 'Camera restarted successfully'})
         else:
@@ -1060,26 +1588,24 @@ def restart_camera():
 def delete_face(face_id):
     """Delete a face from the database"""
     try:
-        conn = sqlite3.connect('database/facial_recognition.db')
-        c = conn.cursor()
+        with db_pool.connection() as conn:
+            c = conn.cursor()
         
-        # Get image path before deleting
-        c.execute("SELECT image_path FROM faces WHERE id = ?", (face_id,))
-        result = c.fetchone()
+            # Get image path before deleting
+            c.execute("SELECT image_path FROM faces WHERE id = ?", (face_id,))
+            result = c.fetchone()
         
-        if result and result[0] and os.path.exists(result[0]):
-            os.remove(result[0])
+            if result and result[0] and os.path.exists(result[0]):
+                os.remove(result[0])
         
-        c.execute("DELETE FROM faces WHERE id = ?", (face_id,))
-        conn.commit()
-        conn.close()
+            c.execute("DELETE FROM faces WHERE id = ?", (face_id,))
+            conn.commit()
         
-        # Reload faces
-        global known_face_encodings, known_face_names
-        known_face_encodings = []
-        known_face_names = []
-        load_known_faces()
-        load_faces_from_db()
+        # Drop the face and its image from the gallery
+        removed_keys = [db_face_key(face_id)]
+        if result and result[0]:
+            removed_keys.append(file_face_key(result[0]))
+        face_gallery.remove(removed_keys)
         
         return redirect(url_for('admin'))
         
@@ -1136,17 +1662,15 @@ def upload_face():
         
         # Save to database
         face_encoding = face_encodings[0]
-        conn = sqlite3.connect('database/facial_recognition.db')
-        c = conn.cursor()
-        encoding_str = json.dumps(face_encoding.tolist())
-        c.execute("INSERT INTO faces (name, encoding, image_path) VALUES (?, ?, ?)",
-                  (name, encoding_str, filepath))
-        conn.commit()
-        conn.close()
+        with db_pool.connection() as conn:
+            c = conn.cursor()
+            c.execute("INSERT INTO faces (name, encoding, image_path) VALUES (?, ?, ?)",
+                      (name, encoding_to_blob(face_encoding), filepath))
+            face_id = c.lastrowid
+            conn.commit()
         
         # Update known faces
-        known_face_encodings.append(face_encoding)
-        known_face_names.append(name)
+        face_gallery.add(db_face_key(face_id), name, face_encoding)
         
         return redirect(url_for('admin'))
         
@@ -1157,21 +1681,33 @@ def upload_face():
 if __name__ == '__main__':
     try:
         init_database()
+        log_retention_job.start()
         logger.info("Loading known faces from files...")
         load_known_faces()
         logger.info("Loading faces from database...")
         load_faces_from_db()
+        load_recent_recognitions()
+        debug = True
+        # The debug reloader serves from a child process; only that one starts the cameras
+        if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            autostart_pipelines()
         print("\n" + "="*50)
         print("🎥 Face Recognition System Started!")
         print("📱 Open: http://localhost:5000")
         print("👥 Features: Live detection, face capture, logging")
         print("⚡ Press Ctrl+C to stop")
         print("="*50 + "\n")
-        app.run(host='0.0.0.0', port=5000, debug=True)
+        app.run(host='0.0.0.0', port=5000, debug=debug)
     except KeyboardInterrupt:
         print("\n\n🛑 Shutting down Face Recognition System...")
-        camera_manager.release()
+        recognition_stage.stop()
+        for pipeline in camera_pipelines.values():
+            pipeline.release()
+        recognition_log_writer.stop()
+        log_retention_job.stop()
+        db_pool.close_all()
         print("✅ Camera released. Goodbye!")
     except Exception as e:
         print(f"\n❌ Error starting application: {e}")
-        camera_manager.release() 
\ No newline at end of file
+        for pipeline in camera_pipelines.values():
+            pipeline.release() 
\ No newline at end of file
@@ -0,0 +1,366 @@
+#!/usr/bin/env python
+"""
+Offline benchmark of the recognition pipeline on recorded media
+
+Runs every stage of the live pipeline on frames from video files or image
+folders, without a camera, and writes latency distributions as JSON:
+
+    python benchmark.py --input recording.mp4 --output results.json
+    python benchmark.py --input frames/ --output new.json --compare results.json
+    python benchmark.py --input corridor.mp4 --prefilter
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import cv2
+import face_recognition
+import numpy as np
+
+from ann import IVFIndex
+from gallery import ENCODING_SIZE, FaceGallery
+from frame_sources import ImageDirectorySource, VideoFileSource
+from overlay import draw_faces
+from recognition import detect_faces, get_cascade
+from tracker import box_iou
+
+STAGES = ('resize', 'color_convert', 'detect', 'encode', 'match', 'draw', 'jpeg_encode')
+
+
+def iter_input_frames(path):
+    """Yield BGR frames from a video file or a directory of images, as fast as they decode"""
+    if os.path.isdir(path):
+        source = ImageDirectorySource(path, pace='max', loop=False)
+    else:
+        source = VideoFileSource(path, pace='max', loop=False)
+    if not source.open():
+        raise IOError(f"Cannot open {path}")
+    try:
+        while True:
+            ok, frame = source.read()
+            if not ok:
+                break
+            yield frame
+    finally:
+        source.release()
+
+
+def distribution(samples):
+    """Latency summary in milliseconds"""
+    if not samples:
+        return {'count': 0}
+    values = np.asarray(samples, dtype=np.float64) * 1000.0
+    return {
+        'count': int(values.size),
+        'mean_ms': round(float(values.mean()), 3),
+        'min_ms': round(float(values.min()), 3),
+        'p50_ms': round(float(np.percentile(values, 50)), 3),
+        'p90_ms': round(float(np.percentile(values, 90)), 3),
+        'p99_ms': round(float(np.percentile(values, 99)), 3),
+        'max_ms': round(float(values.max()), 3),
+    }
+
+
+def synthetic_encodings(size, seed):
+    """Random encodings with the spread of real face encodings"""
+    return np.random.default_rng(seed).normal(0.0, 0.09, (size, ENCODING_SIZE)).astype(np.float32)
+
+
+def synthetic_gallery(size, seed, index=None):
+    """Gallery of synthetic_encodings(size, seed) named Person 0..size-1"""
+    gallery = FaceGallery(initial_capacity=max(size, 1), index=index)
+    encodings = synthetic_encodings(size, seed)
+    gallery.add_many([(f'bench:{i}', f'Person {i}', encodings[i]) for i in range(size)])
+    return gallery
+
+
+def benchmark_frames(args):
+    """Run all pipeline stages on every input frame; returns per-stage samples and counters"""
+    gallery = synthetic_gallery(args.gallery_size, args.seed)
+    samples = {stage: [] for stage in STAGES}
+    prefilter = {'scale_factor': args.prefilter_scale_factor, 'min_neighbors': args.prefilter_min_neighbors,
+                 'min_size': args.prefilter_min_size, 'padding': args.prefilter_padding} if args.prefilter else None
+    reference = {'detect': [], 'empty_detect': [], 'prefiltered_empty_detect': [],
+                 'faces': 0, 'missed': 0, 'extra': 0}
+    encode_by_faces = {}
+    frames = 0
+    faces_total = 0
+    resolution = None
+    pipeline_time = 0.0
+    wall_start = time.perf_counter()
+
+    for path in args.input:
+        for frame in iter_input_frames(path):
+            if args.frames and frames >= args.frames + args.warmup:
+                break
+            resolution = resolution or [int(frame.shape[1]), int(frame.shape[0])]
+            timings = {}
+
+            start = time.perf_counter()
+            small_frame = cv2.resize(frame, (0, 0), fx=args.resize_factor, fy=args.resize_factor)
+            timings['resize'] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
+            timings['color_convert'] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            locations = detect_faces(rgb_small_frame, args.model, args.upsample, prefilter)
+            locations = locations[:args.max_faces]
+            timings['detect'] = time.perf_counter() - start
+
+            if prefilter is not None:
+                # HOG alone on the same frame is the reference for speedup and miss rate
+                start = time.perf_counter()
+                hog_locations = face_recognition.face_locations(rgb_small_frame, args.upsample, args.model)
+                hog_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            encodings = face_recognition.face_encodings(rgb_small_frame, locations) if locations else []
+            timings['encode'] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            matches = gallery.snapshot.best_match(encodings, tolerance=args.tolerance) if encodings else []
+            timings['match'] = time.perf_counter() - start
+
+            faces = [{'location': tuple(int(v / args.resize_factor) for v in location),
+                      'name': name, 'confidence': confidence}
+                     for location, (name, confidence) in zip(locations, matches)]
+            start = time.perf_counter()
+            draw_faces(frame, faces)
+            timings['draw'] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), args.jpeg_quality])
+            timings['jpeg_encode'] = time.perf_counter() - start
+
+            frames += 1
+            if frames <= args.warmup:
+                continue
+            for stage, seconds in timings.items():
+                samples[stage].append(seconds)
+            pipeline_time += sum(timings.values())
+            faces_total += len(locations)
+            encode_by_faces.setdefault(len(locations), []).append(timings['encode'])
+            if prefilter is not None:
+                reference['detect'].append(hog_time)
+                if not hog_locations:
+                    reference['empty_detect'].append(hog_time)
+                    reference['prefiltered_empty_detect'].append(timings['detect'])
+                reference['faces'] += len(hog_locations)
+                reference['missed'] += sum(1 for hog in hog_locations
+                                           if not any(box_iou(hog, found) >= 0.5 for found in locations))
+                reference['extra'] += sum(1 for found in locations
+                                          if not any(box_iou(found, hog) >= 0.5 for hog in hog_locations))
+        else:
+            continue
+        break
+
+    measured = max(frames - args.warmup, 0)
+    wall_time = time.perf_counter() - wall_start
+    results = {
+        'frames': measured,
+        'warmup_frames': min(frames, args.warmup),
+        'resolution': resolution,
+        'faces_detected': faces_total,
+        'stages': {stage: distribution(samples[stage]) for stage in STAGES},
+        'encode_by_faces_per_frame': {str(count): distribution(values)
+                                      for count, values in sorted(encode_by_faces.items())},
+        'end_to_end': {
+            'pipeline_ms_per_frame': round(pipeline_time / measured * 1000.0, 3) if measured else None,
+            'pipeline_fps': round(measured / pipeline_time, 2) if pipeline_time else None,
+            'wall_fps': round(frames / wall_time, 2) if wall_time else None,
+        },
+    }
+    if prefilter is not None:
+        results['prefilter'] = prefilter_report(samples['detect'], reference, prefilter)
+    return results
+
+
+def prefilter_report(prefiltered, reference, settings):
+    """Detection cost and miss rate of the Haar prefilter against HOG alone on the same frames"""
+    def speedup(baseline, candidate):
+        if not baseline or not candidate or not sum(candidate):
+            return None
+        return round(sum(baseline) / sum(candidate), 2)
+
+    return {
+        'settings': settings,
+        'cascade_available': get_cascade() is not None,
+        'detect_prefiltered': distribution(prefiltered),
+        'detect_hog_only': distribution(reference['detect']),
+        'speedup': speedup(reference['detect'], prefiltered),
+        'empty_frames': len(reference['empty_detect']),
+        'empty_frame_speedup': speedup(reference['empty_detect'], reference['prefiltered_empty_detect']),
+        'hog_faces': reference['faces'],
+        'missed_faces': reference['missed'],
+        'miss_rate': round(reference['missed'] / reference['faces'], 4) if reference['faces'] else None,
+        'extra_faces': reference['extra'],
+    }
+
+
+def time_matching(snapshot, queries, args):
+    snapshot.best_match(queries)  # warm up
+    samples = []
+    for _ in range(args.scaling_repeats):
+        start = time.perf_counter()
+        snapshot.best_match(queries, tolerance=args.tolerance)
+        samples.append(time.perf_counter() - start)
+    return distribution(samples)
+
+
+def benchmark_gallery_scaling(args):
+    """Matching latency as a function of gallery size and faces per frame.
+
+    With --ann the same galleries are also matched through the IVF index,
+    with its recall against exhaustive matching on queries close to
+    gallery entries (re-captures of enrolled people).
+    """
+    rng = np.random.default_rng(args.seed + 1)
+    results = []
+    for size in args.scaling_gallery_sizes:
+        gallery = synthetic_gallery(size, args.seed)
+        snapshot = gallery.snapshot
+        indexed = None
+        if args.ann and size:
+            index = IVFIndex(nlist=args.ann_nlist, nprobe=args.ann_nprobe, min_size=1, seed=args.seed)
+            start = time.perf_counter()
+            indexed = synthetic_gallery(size, args.seed, index).snapshot
+            build_seconds = time.perf_counter() - start
+            encodings = synthetic_encodings(size, args.seed)
+            probes = encodings[rng.integers(0, size, 500)] + rng.normal(0.0, 0.02, (500, ENCODING_SIZE)).astype(np.float32)
+            exact = [candidates[0][0] for candidates in snapshot.match(probes)]
+            approximate = [candidates[0][0] if candidates else None for candidates in indexed.match(probes)]
+            recall = sum(a == e for a, e in zip(approximate, exact)) / len(probes)
+        for faces in args.scaling_faces:
+            queries = rng.normal(0.0, 0.09, (faces, ENCODING_SIZE)).astype(np.float32)
+            result = {'gallery_size': size, 'faces_per_frame': faces, 'match': time_matching(snapshot, queries, args)}
+            if indexed is not None:
+                result['ann_match'] = time_matching(indexed, queries, args)
+                result['ann_recall'] = round(recall, 4)
+                result['ann_build_seconds'] = round(build_seconds, 2)
+            results.append(result)
+    return results
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'opencv': cv2.__version__,
+        'numpy': np.__version__,
+        'face_recognition': getattr(face_recognition, '__version__', None),
+    }
+
+
+def compare(results, baseline, threshold):
+    """Print per-stage changes against a baseline; returns the stages that regressed"""
+    regressions = []
+    print(f"\n{'stage':<16}{'baseline p50':>14}{'current p50':>14}{'change':>10}")
+    for stage in STAGES:
+        old = baseline.get('stages', {}).get(stage, {}).get('p50_ms')
+        new = results['stages'].get(stage, {}).get('p50_ms')
+        if old is None or new is None:
+            continue
+        change = (new - old) / old * 100.0 if old else 0.0
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(stage)
+        print(f"{stage:<16}{old:>12.2f}ms{new:>12.2f}ms{change:>9.1f}%{flag}")
+    old_fps = baseline.get('end_to_end', {}).get('pipeline_fps')
+    new_fps = results['end_to_end'].get('pipeline_fps')
+    if old_fps and new_fps:
+        print(f"{'pipeline fps':<16}{old_fps:>14.2f}{new_fps:>14.2f}{(new_fps - old_fps) / old_fps * 100.0:>9.1f}%")
+    return regressions
+
+
+def parse_int_list(value):
+    return [int(v) for v in value.split(',') if v]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the face recognition pipeline")
+    parser.add_argument('--input', action='append', required=True,
+                        help="video file or directory of images (repeatable)")
+    parser.add_argument('--output', help="write results as JSON to this file")
+    parser.add_argument('--compare', help="baseline JSON from an earlier run")
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help="percent p50 slowdown reported as a regression (default 10)")
+    parser.add_argument('--frames', type=int, default=0, help="stop after this many measured frames (0 = all)")
+    parser.add_argument('--warmup', type=int, default=3, help="frames run before measuring")
+    parser.add_argument('--resize-factor', type=float, default=0.25)
+    parser.add_argument('--model', default='hog', choices=('hog', 'cnn'))
+    parser.add_argument('--upsample', type=int, default=0)
+    parser.add_argument('--max-faces', type=int, default=3)
+    parser.add_argument('--tolerance', type=float, default=0.6)
+    parser.add_argument('--jpeg-quality', type=int, default=80)
+    parser.add_argument('--gallery-size', type=int, default=100, help="synthetic gallery used for matching")
+    parser.add_argument('--scaling-gallery-sizes', type=parse_int_list, default=[10, 100, 1000, 10000])
+    parser.add_argument('--scaling-faces', type=parse_int_list, default=[1, 2, 4, 8])
+    parser.add_argument('--scaling-repeats', type=int, default=200)
+    parser.add_argument('--ann', action='store_true',
+                        help="also match the scaling galleries through the IVF index and report its recall")
+    parser.add_argument('--ann-nlist', type=int, default=0, help="IVF lists (0 = about twice the square root of the size)")
+    parser.add_argument('--ann-nprobe', type=int, default=8, help="IVF lists scanned per face")
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--prefilter', action='store_true',
+                        help="screen frames with the Haar cascade before HOG and compare against HOG alone")
+    parser.add_argument('--prefilter-scale-factor', type=float, default=1.1)
+    parser.add_argument('--prefilter-min-neighbors', type=int, default=3)
+    parser.add_argument('--prefilter-min-size', type=int, default=20)
+    parser.add_argument('--prefilter-padding', type=float, default=0.5)
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+
+    print("Running pipeline stages on recorded frames...")
+    results = benchmark_frames(args)
+    if not results['frames']:
+        print("❌ No frames could be read from the input")
+        return 2
+    print("Measuring gallery scaling...")
+    results['gallery_scaling'] = benchmark_gallery_scaling(args)
+    results['environment'] = environment()
+    results['settings'] = {key: value for key, value in vars(args).items()
+                           if key not in ('output', 'compare', 'threshold')}
+    results['created_at'] = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+
+    print(f"\n{results['frames']} frames at {results['resolution'][0]}x{results['resolution'][1]}, "
+          f"{results['faces_detected']} faces")
+    for stage in STAGES:
+        stats = results['stages'][stage]
+        print(f"  {stage:<14} p50 {stats['p50_ms']:8.2f}ms  p90 {stats['p90_ms']:8.2f}ms  p99 {stats['p99_ms']:8.2f}ms")
+    print(f"  pipeline: {results['end_to_end']['pipeline_fps']} fps")
+    if 'prefilter' in results:
+        report = results['prefilter']
+        print(f"  prefilter: {report['speedup']}x faster detection "
+              f"({report['empty_frame_speedup']}x on {report['empty_frames']} empty frames), "
+              f"missed {report['missed_faces']} of {report['hog_faces']} HOG faces")
+    for result in results['gallery_scaling']:
+        if 'ann_match' in result and result['faces_per_frame'] == args.scaling_faces[0]:
+            print(f"  ann @ {result['gallery_size']}: p50 {result['ann_match']['p50_ms']:.3f}ms "
+                  f"vs exhaustive {result['match']['p50_ms']:.3f}ms, recall {result['ann_recall']}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n✅ Results written to {args.output}")
+
+    if baseline is not None:
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,653 @@
+#!/usr/bin/env python
+"""
+Database schema, migrations and face encoding storage for the Face Recognition System
+"""
+
+import atexit
+import base64
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import numpy as np
+
+from gallery import ENCODING_SIZE
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = 'database/facial_recognition.db'
+
+# Encodings are stored as raw little-endian float32 BLOBs
+ENCODING_DTYPE = np.dtype('<f4')
+ENCODING_BYTES = ENCODING_SIZE * ENCODING_DTYPE.itemsize
+
+# Bumped by every migration in MIGRATIONS (stored in PRAGMA user_version)
+SCHEMA_VERSION = 3
+
+# How long a connection waits for a write lock before giving up
+BUSY_TIMEOUT_SECONDS = 5.0
+
+
+def encoding_to_blob(encoding):
+    """Serialize a face encoding to a float32 BLOB"""
+    return np.asarray(encoding, dtype=ENCODING_DTYPE).reshape(ENCODING_SIZE).tobytes()
+
+
+def blob_to_encoding(blob):
+    """Deserialize a float32 BLOB back to an encoding"""
+    return np.frombuffer(blob, dtype=ENCODING_DTYPE).astype(np.float32)
+
+
+def connect(db_path=DB_PATH, timeout=BUSY_TIMEOUT_SECONDS, **kwargs):
+    """Open a connection with the settings every part of the app should use"""
+    conn = sqlite3.connect(db_path, timeout=timeout, cached_statements=256, **kwargs)
+    # WAL lets the dashboard read while the log writer commits; NORMAL is durable enough with WAL
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class ConnectionPool:
+    """Hands out long-lived SQLite connections, one thread at a time.
+
+    Reusing connections keeps sqlite3's per-connection statement cache warm,
+    so repeated queries are prepared once instead of on every request. Idle
+    connections beyond ``max_idle`` are closed.
+    """
+
+    def __init__(self, db_path=DB_PATH, max_idle=8, timeout=BUSY_TIMEOUT_SECONDS):
+        self.db_path = db_path
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return connect(self.db_path, self.timeout, check_same_thread=False)
+
+    def release(self, conn):
+        if conn.in_transaction:
+            # Never hand a half-finished transaction to the next user
+            conn.rollback()
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of a with-block"""
+        conn = self.acquire()
+        try:
+            yield conn
+        except sqlite3.Error:
+            # The connection may be unusable; don't return it to the pool
+            conn.close()
+            raise
+        except BaseException:
+            self.release(conn)
+            raise
+        else:
+            self.release(conn)
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+def create_tables(conn):
+    """Create the tables for a fresh database"""
+    c = conn.cursor()
+
+    # Create faces table
+    c.execute('''CREATE TABLE IF NOT EXISTS faces
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  name TEXT NOT NULL,
+                  encoding BLOB NOT NULL,
+                  image_path TEXT,
+                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+
+    # Create recognition logs table
+    c.execute('''CREATE TABLE IF NOT EXISTS recognition_logs
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  name TEXT NOT NULL,
+                  confidence REAL,
+                  timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                  screenshot TEXT)''')
+
+
+def migrate_encodings_to_blob(conn):
+    """Version 1: convert JSON text encodings to float32 BLOBs.
+
+    Rows whose encoding cannot be read are moved unchanged to
+    faces_quarantine, with the reason, so they can be repaired or re-enrolled.
+    """
+    c = conn.cursor()
+    c.execute('''CREATE TABLE faces_new
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  name TEXT NOT NULL,
+                  encoding BLOB NOT NULL,
+                  image_path TEXT,
+                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS faces_quarantine
+                 (id INTEGER PRIMARY KEY,
+                  name TEXT,
+                  encoding,
+                  image_path TEXT,
+                  created_at TIMESTAMP,
+                  error TEXT)''')
+
+    converted = 0
+    quarantined = 0
+    for face_id, name, encoding, image_path, created_at in c.execute(
+            "SELECT id, name, encoding, image_path, created_at FROM faces").fetchall():
+        try:
+            if isinstance(encoding, str):
+                blob = encoding_to_blob(json.loads(encoding))
+                converted += 1
+            else:
+                blob = encoding_to_blob(blob_to_encoding(encoding))
+        except (ValueError, TypeError) as e:
+            logger.warning(f"Moving face {face_id} ({name}) with unreadable encoding to faces_quarantine: {e}")
+            c.execute("INSERT INTO faces_quarantine (id, name, encoding, image_path, created_at, error) "
+                      "VALUES (?, ?, ?, ?, ?, ?)", (face_id, name, encoding, image_path, created_at, str(e)))
+            quarantined += 1
+            continue
+        c.execute("INSERT INTO faces_new (id, name, encoding, image_path, created_at) VALUES (?, ?, ?, ?, ?)",
+                  (face_id, name, blob, image_path, created_at))
+
+    c.execute("DROP TABLE faces")
+    c.execute("ALTER TABLE faces_new RENAME TO faces")
+    logger.info(f"Migrated {converted} face encodings to binary storage")
+    if quarantined:
+        logger.error(f"{quarantined} faces with unreadable encodings were kept in faces_quarantine "
+                     f"and are not recognized until they are repaired or re-enrolled")
+
+
+def add_query_indexes(conn):
+    """Version 2: indexes for the time-window and per-name queries on the dashboard"""
+    c = conn.cursor()
+    c.execute("CREATE INDEX IF NOT EXISTS idx_recognition_logs_timestamp ON recognition_logs (timestamp)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_recognition_logs_name_timestamp ON recognition_logs (name, timestamp)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_faces_name ON faces (name)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_faces_created_at ON faces (created_at)")
+
+
+def create_rollup_tables(conn):
+    """Version 3: hourly and daily per-identity summaries of recognition_logs"""
+    c = conn.cursor()
+    for table, period in (('recognition_hourly', 'hour'), ('recognition_daily', 'day')):
+        c.execute(f'''CREATE TABLE IF NOT EXISTS {table}
+                     (name TEXT NOT NULL,
+                      {period} TEXT NOT NULL,
+                      count INTEGER NOT NULL,
+                      confidence_sum REAL NOT NULL,
+                      max_confidence REAL,
+                      last_seen TIMESTAMP,
+                      PRIMARY KEY (name, {period}))''')
+        c.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{period} ON {table} ({period})")
+    # Highest recognition_logs id already counted in the summaries
+    c.execute('''CREATE TABLE IF NOT EXISTS rollup_state
+                 (key TEXT PRIMARY KEY,
+                  value INTEGER NOT NULL)''')
+
+
+MIGRATIONS = {
+    1: migrate_encodings_to_blob,
+    2: add_query_indexes,
+    3: create_rollup_tables,
+}
+
+
+def migrate_database(conn):
+    """Apply any pending schema migrations, each in its own transaction"""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for target in range(version + 1, SCHEMA_VERSION + 1):
+        logger.info(f"Migrating database schema to version {target}")
+        try:
+            conn.execute("BEGIN")
+            MIGRATIONS[target](conn)
+            conn.execute(f"PRAGMA user_version = {target}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+
+def init_database(db_path=DB_PATH):
+    """Create missing tables and bring the schema up to date"""
+    os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+    # Manage transactions explicitly so migrations are all-or-nothing
+    conn = connect(db_path, isolation_level=None)
+    try:
+        is_new = conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE type='table' AND name='faces'").fetchone()[0] == 0
+        create_tables(conn)
+        if is_new:
+            add_query_indexes(conn)
+            create_rollup_tables(conn)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        else:
+            migrate_database(conn)
+    finally:
+        conn.close()
+
+
+def load_face_encodings(conn):
+    """Bulk load all stored encodings.
+
+    Returns ``(ids, names, matrix)`` where matrix is an ``(n, 128)`` float32
+    array built from one concatenated buffer rather than per-row parsing.
+    """
+    rows = conn.execute("SELECT id, name, encoding FROM faces WHERE length(encoding) = ? ORDER BY id",
+                        (ENCODING_BYTES,)).fetchall()
+    if not rows:
+        return [], [], np.zeros((0, ENCODING_SIZE), dtype=np.float32)
+    ids, names, blobs = zip(*rows)
+    matrix = np.frombuffer(b''.join(blobs), dtype=ENCODING_DTYPE).reshape(len(rows), ENCODING_SIZE)
+    return list(ids), list(names), matrix.astype(np.float32)
+
+
+# Relative time windows accepted by recognition_log_filter
+LOG_PERIODS = {
+    'hour': '-1 hour',
+    'day': '-1 day',
+    'week': '-7 days',
+}
+
+
+def normalize_timestamp(value):
+    """Parse an ISO date or date-time into the stored UTC timestamp format; values without an offset are UTC"""
+    value = value.strip()
+    if value.endswith(('Z', 'z')):
+        value = value[:-1] + '+00:00'
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc)
+    return parsed.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def recognition_log_filter(name=None, search=None, min_confidence=None, max_confidence=None,
+                           since=None, until=None, period=None):
+    """Build ``(where, params)`` for filtering recognition_logs.
+
+    name matches exactly, search is a case-insensitive substring.
+    min_confidence is exclusive and max_confidence inclusive, matching the
+    confidence levels shown in the UI. since/until are UTC timestamps and
+    period is one of LOG_PERIODS. Raises ValueError on malformed values.
+    """
+    conditions = []
+    params = []
+    if name:
+        conditions.append("name = ?")
+        params.append(name)
+    if search:
+        conditions.append("name LIKE ? ESCAPE '\\'")
+        params.append('%' + search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+    if min_confidence is not None:
+        conditions.append("confidence > ?")
+        params.append(float(min_confidence))
+    if max_confidence is not None:
+        conditions.append("confidence <= ?")
+        params.append(float(max_confidence))
+    if since:
+        conditions.append("timestamp >= ?")
+        params.append(normalize_timestamp(since))
+    if until:
+        conditions.append("timestamp < ?")
+        params.append(normalize_timestamp(until))
+    if period:
+        if period not in LOG_PERIODS:
+            raise ValueError(f"Unknown period: {period}")
+        conditions.append("timestamp > datetime('now', ?)")
+        params.append(LOG_PERIODS[period])
+    return ' AND '.join(conditions), params
+
+
+def encode_log_cursor(timestamp, log_id):
+    """Opaque keyset cursor for the row (timestamp, id)"""
+    return base64.urlsafe_b64encode(f"{timestamp}|{log_id}".encode()).decode().rstrip('=')
+
+
+def decode_log_cursor(cursor):
+    """Inverse of encode_log_cursor; raises ValueError on a malformed cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        timestamp, log_id = raw.rsplit('|', 1)
+        return timestamp, int(log_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def query_recognition_logs(conn, where='', params=(), limit=100, cursor=None):
+    """One page of logs, newest first, with keyset pagination on (timestamp, id).
+
+    Returns ``(rows, next_cursor)`` where rows are ``(id, name, confidence,
+    timestamp)`` and next_cursor is None on the last page. Each page is an
+    index range scan, however deep into the history it is.
+    """
+    conditions = [where] if where else []
+    params = list(params)
+    if cursor:
+        conditions.append("(timestamp, id) < (?, ?)")
+        params.extend(decode_log_cursor(cursor))
+    sql = "SELECT id, name, confidence, timestamp FROM recognition_logs"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY timestamp DESC, id DESC LIMIT ?"
+    rows = conn.execute(sql, params + [limit + 1]).fetchall()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_log_cursor(rows[-1][3], rows[-1][0])
+
+
+def iter_recognition_logs(conn, where='', params=(), chunk_size=1000):
+    """Yield all matching logs, newest first, in lists of up to chunk_size rows.
+
+    Rows are pulled from one open cursor as they are consumed, so memory use
+    does not depend on how many rows match.
+    """
+    sql = "SELECT id, name, confidence, timestamp FROM recognition_logs"
+    if where:
+        sql += " WHERE " + where
+    sql += " ORDER BY timestamp DESC, id DESC"
+    c = conn.execute(sql, list(params))
+    try:
+        while True:
+            rows = c.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        c.close()
+
+
+# Summary table -> expression truncating a log timestamp to its period
+ROLLUP_PERIODS = {
+    'recognition_hourly': ('hour', "strftime('%Y-%m-%d %H:00:00', timestamp)"),
+    'recognition_daily': ('day', "date(timestamp)"),
+}
+
+
+def rollup_recognition_logs(conn, batch_size=5000):
+    """Fold up to batch_size not yet summarized log rows into the hourly and daily tables.
+
+    Runs in one short transaction and returns the number of rows rolled up.
+    """
+    with conn:
+        row = conn.execute("SELECT value FROM rollup_state WHERE key = 'logs_watermark'").fetchone()
+        watermark = row[0] if row else 0
+        upper = conn.execute("""SELECT MAX(id), COUNT(*) FROM
+                                (SELECT id FROM recognition_logs WHERE id > ? ORDER BY id LIMIT ?)""",
+                             (watermark, batch_size)).fetchone()
+        if not upper[1]:
+            return 0
+        for table, (period, bucket) in ROLLUP_PERIODS.items():
+            conn.execute(f"""INSERT INTO {table} (name, {period}, count, confidence_sum, max_confidence, last_seen)
+                             SELECT name, {bucket}, COUNT(*), TOTAL(confidence), MAX(confidence), MAX(timestamp)
+                             FROM recognition_logs WHERE id > ? AND id <= ?
+                             GROUP BY name, {bucket}
+                             ON CONFLICT (name, {period}) DO UPDATE SET
+                                 count = count + excluded.count,
+                                 confidence_sum = confidence_sum + excluded.confidence_sum,
+                                 max_confidence = MAX(COALESCE(max_confidence, 0), COALESCE(excluded.max_confidence, 0)),
+                                 last_seen = MAX(COALESCE(last_seen, ''), COALESCE(excluded.last_seen, ''))""",
+                         (watermark, upper[0]))
+        conn.execute("INSERT OR REPLACE INTO rollup_state (key, value) VALUES ('logs_watermark', ?)", (upper[0],))
+        return upper[1]
+
+
+def prune_recognition_logs(conn, max_age_days=None, max_rows=None, batch_size=500):
+    """Delete one batch of summarized raw log rows that are too old or beyond max_rows.
+
+    Only rows already counted in the summaries are removed. Returns the
+    number of deleted rows; callers repeat until it returns 0.
+    """
+    with conn:
+        row = conn.execute("SELECT value FROM rollup_state WHERE key = 'logs_watermark'").fetchone()
+        limit_id = row[0] if row else 0
+        conditions = []
+        params = [limit_id]
+        if max_age_days is not None:
+            conditions.append("timestamp < datetime('now', ?)")
+            params.append(f"-{max_age_days} days")
+        if max_rows is not None:
+            # Everything older than the newest max_rows rows
+            cutoff = conn.execute("SELECT id FROM recognition_logs ORDER BY id DESC LIMIT 1 OFFSET ?",
+                                  (max_rows,)).fetchone()
+            if cutoff:
+                conditions.append("id <= ?")
+                params.append(cutoff[0])
+        if not conditions:
+            return 0
+        params.append(batch_size)
+        return conn.execute(f"""DELETE FROM recognition_logs WHERE id IN
+                                (SELECT id FROM recognition_logs WHERE id <= ? AND ({' OR '.join(conditions)})
+                                 ORDER BY id LIMIT ?)""", params).rowcount
+
+
+def prune_hourly_rollups(conn, max_age_days):
+    """Drop hourly summaries older than max_age_days; the daily table keeps the history"""
+    with conn:
+        return conn.execute("DELETE FROM recognition_hourly WHERE hour < strftime('%Y-%m-%d %H:00:00', 'now', ?)",
+                            (f"-{max_age_days} days",)).rowcount
+
+
+def rename_identity_rollups(conn, old_name, new_name):
+    """Merge the summaries of old_name into new_name (part of the caller's transaction)"""
+    if old_name == new_name:
+        return
+    for table, (period, _) in ROLLUP_PERIODS.items():
+        conn.execute(f"""INSERT INTO {table} (name, {period}, count, confidence_sum, max_confidence, last_seen)
+                         SELECT ?, {period}, count, confidence_sum, max_confidence, last_seen
+                         FROM {table} WHERE name = ?
+                         ON CONFLICT (name, {period}) DO UPDATE SET
+                             count = count + excluded.count,
+                             confidence_sum = confidence_sum + excluded.confidence_sum,
+                             max_confidence = MAX(COALESCE(max_confidence, 0), COALESCE(excluded.max_confidence, 0)),
+                             last_seen = MAX(COALESCE(last_seen, ''), COALESCE(excluded.last_seen, ''))""",
+                     (new_name, old_name))
+        conn.execute(f"DELETE FROM {table} WHERE name = ?", (old_name,))
+
+
+def delete_identity_rollups(conn, name):
+    """Remove the summaries of a deleted person (part of the caller's transaction)"""
+    for table in ROLLUP_PERIODS:
+        conn.execute(f"DELETE FROM {table} WHERE name = ?", (name,))
+
+
+class LogRetentionJob:
+    """Background rollup and pruning of recognition_logs.
+
+    Every ``interval`` seconds new log rows are folded into the hourly and
+    daily summary tables, then raw rows older than ``max_age_days`` or beyond
+    the newest ``max_rows`` are deleted. Deletes run in small batches with a
+    pause in between, so the log writer never waits long for the write lock.
+    """
+
+    def __init__(self, db_path=DB_PATH, interval=60.0, max_age_days=30, max_rows=None,
+                 hourly_max_age_days=90, batch_size=500, batch_pause=0.05):
+        self.db_path = db_path
+        self.interval = interval
+        self.max_age_days = max_age_days
+        self.max_rows = max_rows
+        self.hourly_max_age_days = hourly_max_age_days
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.rolled_up = 0
+        self.pruned = 0
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="log-retention", daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def stop(self, timeout=5.0):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._stop_event.set()
+        thread.join(timeout)
+
+    def run_once(self, conn):
+        """One rollup and prune pass; returns (rows rolled up, rows pruned)"""
+        rolled_up = 0
+        while not self._stop_event.is_set():
+            count = rollup_recognition_logs(conn, self.batch_size * 10)
+            rolled_up += count
+            if count == 0:
+                break
+            self._stop_event.wait(self.batch_pause)
+
+        pruned = 0
+        if self.max_age_days is not None or self.max_rows is not None:
+            while not self._stop_event.is_set():
+                count = prune_recognition_logs(conn, self.max_age_days, self.max_rows, self.batch_size)
+                pruned += count
+                if count == 0:
+                    break
+                self._stop_event.wait(self.batch_pause)
+        if self.hourly_max_age_days is not None:
+            prune_hourly_rollups(conn, self.hourly_max_age_days)
+
+        self.rolled_up += rolled_up
+        self.pruned += pruned
+        if rolled_up or pruned:
+            logger.info(f"Log retention: rolled up {rolled_up} rows, pruned {pruned} rows")
+        return rolled_up, pruned
+
+    def _run(self):
+        conn = connect(self.db_path, timeout=30.0)
+        try:
+            while True:
+                try:
+                    self.run_once(conn)
+                except sqlite3.Error as e:
+                    logger.warning(f"Log retention pass failed: {e}")
+                if self._stop_event.wait(self.interval):
+                    break
+        finally:
+            conn.close()
+
+
+class RecognitionLogWriter:
+    """Writes recognition events from a background thread in batched transactions.
+
+    ``log`` only puts the event on a bounded in-memory queue, so the video path
+    never touches the database. When the queue is full (the database is stuck)
+    new events are dropped and counted instead of blocking the caller.
+    """
+
+    def __init__(self, db_path=DB_PATH, max_queue=10000, batch_size=500, flush_interval=1.0):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.written = 0
+        self.dropped = 0
+        self._thread = None
+        self._stop = object()
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="recognition-log-writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def stop(self, timeout=5.0):
+        """Flush pending events and stop the writer thread"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self.queue.put(self._stop)
+        thread.join(timeout)
+
+    def log(self, name, confidence):
+        """Queue one recognition event; returns False if it had to be dropped"""
+        # Same format as CURRENT_TIMESTAMP, taken now rather than when the batch is written
+        timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+        try:
+            self.queue.put_nowait((name, float(confidence), timestamp))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logger.warning(f"Recognition log queue full, dropped {self.dropped} events so far")
+            return False
+
+    def _run(self):
+        conn = connect(self.db_path, timeout=30.0)
+        try:
+            stopping = False
+            while not stopping:
+                try:
+                    item = self.queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    continue
+                batch = []
+                deadline = time.time() + self.flush_interval
+                while True:
+                    if item is self._stop:
+                        stopping = True
+                    else:
+                        batch.append(item)
+                    if stopping or len(batch) >= self.batch_size:
+                        break
+                    try:
+                        item = self.queue.get(timeout=max(0.0, deadline - time.time()))
+                    except queue.Empty:
+                        break
+                if stopping:
+                    # Drain whatever is still queued so nothing is lost on shutdown
+                    while True:
+                        try:
+                            item = self.queue.get_nowait()
+                        except queue.Empty:
+                            break
+                        if item is not self._stop:
+                            batch.append(item)
+                if batch:
+                    self._write(conn, batch)
+        finally:
+            conn.close()
+
+    def _write(self, conn, batch):
+        for attempt in range(3):
+            try:
+                with conn:
+                    conn.executemany("INSERT INTO recognition_logs (name, confidence, timestamp) VALUES (?, ?, ?)",
+                                     batch)
+                self.written += len(batch)
+                logger.debug(f"Wrote {len(batch)} recognition events")
+                return
+            except sqlite3.OperationalError as e:
+                logger.warning(f"Recognition log write failed (attempt {attempt + 1}): {e}")
+                time.sleep(0.5 * (attempt + 1))
+            except Exception as e:
+                logger.error(f"Error writing recognition logs: {e}")
+                break
+        self.dropped += len(batch)
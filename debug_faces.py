@@ -5,9 +5,9 @@ Debug script to test face recognition functionality
 
 import cv2
 import face_recognition
-import json
 import sqlite3
 import numpy as np
+from database import load_face_encodings
 
 def debug_face_recognition():
     print("="*60)
@@ -29,18 +29,11 @@ def debug_face_recognition():
     print("\n2. Loading known faces from database...")
     try:
         conn = sqlite3.connect('database/facial_recognition.db')
-        c = conn.cursor()
-        c.execute("SELECT name, encoding FROM faces")
-        faces = c.fetchall()
+        _, names, encodings = load_face_encodings(conn)
         conn.close()
         
-        known_face_encodings = []
-        known_face_names = []
-        
-        for name, encoding_str in faces:
-            encoding = np.array(json.loads(encoding_str))
-            known_face_encodings.append(encoding)
-            known_face_names.append(name)
+        known_face_encodings = list(encodings)
+        known_face_names = list(names)
         
         print(f"✅ Loaded {len(known_face_names)} known faces: {known_face_names}")
         
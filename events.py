@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""
+Server-Sent Events hub that pushes dashboard updates to every open page
+"""
+
+import json
+import threading
+from collections import deque
+
+
+def format_event(seq, event_type, payload):
+    """One SSE message; payload is already JSON encoded"""
+    return f"id: {seq}\nevent: {event_type}\ndata: {payload}\n\n"
+
+
+class EventHub:
+    """Fans events out to any number of SSE subscribers.
+
+    Events are serialized once in ``publish`` and kept in a short history so a
+    reconnecting browser can resume from its ``Last-Event-ID``. State topics
+    (``set_state``) remember their latest value, are only published when that
+    value changes, and are replayed to every new subscriber, so a freshly
+    opened page is complete without an extra request.
+    """
+
+    def __init__(self, history=256, retry_ms=2000):
+        self.retry_ms = retry_ms
+        self._condition = threading.Condition()
+        self._events = deque(maxlen=history)  # (seq, event type, JSON payload)
+        self._state = {}                      # event type -> (seq, JSON payload)
+        self._seq = 0
+        self._subscribers = 0
+
+    @property
+    def subscriber_count(self):
+        with self._condition:
+            return self._subscribers
+
+    def _append(self, event_type, payload):
+        self._seq += 1
+        self._events.append((self._seq, event_type, payload))
+        self._condition.notify_all()
+        return self._seq
+
+    def publish(self, event_type, data):
+        """Push one event to all subscribers"""
+        payload = json.dumps(data)
+        with self._condition:
+            self._append(event_type, payload)
+
+    def set_state(self, event_type, data):
+        """Publish the latest value of a state topic if it changed; returns True when published"""
+        payload = json.dumps(data, sort_keys=True)
+        with self._condition:
+            current = self._state.get(event_type)
+            if current is not None and current[1] == payload:
+                return False
+            self._state[event_type] = (self._append(event_type, payload), payload)
+            return True
+
+    def _pending(self, last_seq):
+        """Events after last_seq; falls back to the current state if the history no longer reaches back"""
+        if self._events and self._events[0][0] > last_seq + 1:
+            states = sorted((seq, event_type, payload) for event_type, (seq, payload) in self._state.items())
+            return states + [event for event in self._events if event[0] > last_seq and event[1] not in self._state]
+        return [event for event in self._events if event[0] > last_seq]
+
+    def subscribe(self, last_event_id=None, timeout=15.0):
+        """Generator of SSE messages for one client; sends a keepalive comment every ``timeout`` seconds"""
+        with self._condition:
+            self._subscribers += 1
+            if last_event_id is not None and last_event_id <= self._seq:
+                pending = self._pending(last_event_id)
+            else:
+                pending = sorted((seq, event_type, payload) for event_type, (seq, payload) in self._state.items())
+            last_seq = self._seq
+        try:
+            yield f"retry: {self.retry_ms}\n\n"
+            while True:
+                for seq, event_type, payload in pending:
+                    yield format_event(seq, event_type, payload)
+                with self._condition:
+                    if not self._condition.wait_for(lambda: self._seq != last_seq, timeout):
+                        pending = None
+                    else:
+                        pending = self._pending(last_seq)
+                        last_seq = self._seq
+                if pending is None:
+                    pending = []
+                    yield ": keepalive\n\n"
+        finally:
+            with self._condition:
+                self._subscribers -= 1
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+"""
+On-disk encoding cache for the face_images directory
+"""
+
+import hashlib
+import logging
+import os
+import threading
+
+import face_recognition
+import numpy as np
+
+from gallery import ENCODING_SIZE
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 1
+
+
+def file_content_hash(path):
+    """SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class EncodingCache:
+    """Caches one face encoding per image, keyed by content hash and model parameters.
+
+    File size and mtime are remembered per path so unchanged files are not even
+    re-hashed; a renamed or copied image is found by its hash and never
+    re-encoded. Changing any encoding parameter invalidates the whole cache.
+    """
+
+    def __init__(self, cache_path, model='hog', number_of_times_to_upsample=1, num_jitters=1,
+                 landmarks_model='small'):
+        self.cache_path = cache_path
+        self.model = model
+        self.number_of_times_to_upsample = number_of_times_to_upsample
+        self.num_jitters = num_jitters
+        self.landmarks_model = landmarks_model
+        self.params_key = (f"v{CACHE_VERSION};model={model};upsample={number_of_times_to_upsample};"
+                           f"jitters={num_jitters};landmarks={landmarks_model}")
+        self.encodings = {}  # content hash -> float32 encoding, or None when the image has no face
+        self.files = {}      # path -> (size, mtime_ns, content hash)
+        self.lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.cache_path):
+            return
+        try:
+            with np.load(self.cache_path) as data:
+                if str(data['params']) != self.params_key:
+                    logger.info("Encoding cache parameters changed, rebuilding cache")
+                    return
+                for content_hash, encoding, has_face in zip(data['hashes'], data['encodings'], data['has_face']):
+                    self.encodings[str(content_hash)] = encoding.copy() if has_face else None
+                for path, size, mtime_ns, content_hash in zip(data['paths'], data['sizes'],
+                                                              data['mtimes'], data['path_hashes']):
+                    self.files[str(path)] = (int(size), int(mtime_ns), str(content_hash))
+            logger.info(f"Loaded {len(self.encodings)} cached image encodings")
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable encoding cache {self.cache_path}: {e}")
+            self.encodings = {}
+            self.files = {}
+
+    def save(self):
+        """Write the cache atomically"""
+        hashes = list(self.encodings)
+        encodings = np.zeros((len(hashes), ENCODING_SIZE), dtype=np.float32)
+        has_face = np.zeros(len(hashes), dtype=bool)
+        for i, content_hash in enumerate(hashes):
+            if self.encodings[content_hash] is not None:
+                encodings[i] = self.encodings[content_hash]
+                has_face[i] = True
+        paths = list(self.files)
+
+        os.makedirs(os.path.dirname(self.cache_path) or '.', exist_ok=True)
+        tmp_path = self.cache_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f,
+                     params=np.array(self.params_key),
+                     hashes=np.array(hashes, dtype=str),
+                     encodings=encodings,
+                     has_face=has_face,
+                     paths=np.array(paths, dtype=str),
+                     sizes=np.array([self.files[p][0] for p in paths], dtype=np.int64),
+                     mtimes=np.array([self.files[p][1] for p in paths], dtype=np.int64),
+                     path_hashes=np.array([self.files[p][2] for p in paths], dtype=str))
+        os.replace(tmp_path, self.cache_path)
+
+    def _encode(self, path):
+        image = face_recognition.load_image_file(path)
+        locations = face_recognition.face_locations(image, self.number_of_times_to_upsample, self.model)
+        encodings = face_recognition.face_encodings(image, locations, self.num_jitters, self.landmarks_model)
+        return encodings[0].astype(np.float32) if encodings else None
+
+    def refresh(self, paths):
+        """Bring the cache in line with the given image paths.
+
+        Only new or modified files are hashed, and only unseen content is
+        encoded. Returns ``{path: encoding or None}`` for every path.
+        """
+        with self.lock:
+            return self._refresh(paths)
+
+    def _refresh(self, paths):
+        results = {}
+        changed = False
+        for path in paths:
+            try:
+                stat = os.stat(path)
+                cached = self.files.get(path)
+                if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+                    content_hash = cached[2]
+                else:
+                    content_hash = file_content_hash(path)
+                    self.files[path] = (stat.st_size, stat.st_mtime_ns, content_hash)
+                    changed = True
+
+                if content_hash not in self.encodings:
+                    self.encodings[content_hash] = self._encode(path)
+                    changed = True
+                results[path] = self.encodings[content_hash]
+            except Exception as e:
+                logger.error(f"Error encoding {path}: {e}")
+                results[path] = None
+
+        # Forget files that were removed and encodings nothing refers to any more
+        for path in [p for p in self.files if p not in results]:
+            del self.files[path]
+            changed = True
+        live_hashes = {entry[2] for entry in self.files.values()}
+        for content_hash in [h for h in self.encodings if h not in live_hashes]:
+            del self.encodings[content_hash]
+            changed = True
+
+        if changed:
+            try:
+                self.save()
+            except Exception as e:
+                logger.warning(f"Failed to save encoding cache: {e}")
+        return results
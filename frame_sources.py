@@ -0,0 +1,367 @@
+#!/usr/bin/env python
+"""
+Frame sources feeding the video pipeline: camera devices, recorded media and network streams
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import cv2
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+PACE_MODES = ('realtime', 'max')
+
+
+class FrameSource:
+    """Base class of everything the capture path can read frames from.
+
+    ``read`` returns ``(success, frame)`` like ``cv2.VideoCapture.read``.
+    ``finished`` is set once a recorded source has played to its end and will
+    not produce more frames, so callers can tell it apart from a camera that
+    needs to be reopened.
+    """
+
+    description = 'frame source'
+
+    def __init__(self):
+        self.finished = False
+
+    def open(self):
+        """Open the source; returns True on success"""
+        raise NotImplementedError
+
+    def is_opened(self):
+        raise NotImplementedError
+
+    def read(self):
+        raise NotImplementedError
+
+    def release(self):
+        pass
+
+
+class PacedSource(FrameSource):
+    """Recorded media replayed either at its own frame rate or as fast as possible"""
+
+    def __init__(self, fps=30.0, pace='realtime', loop=True):
+        super().__init__()
+        if pace not in PACE_MODES:
+            raise ValueError(f"pace must be one of {', '.join(PACE_MODES)}")
+        self.fps = fps
+        self.pace = pace
+        self.loop = loop
+        self._next_frame_time = None
+
+    def _wait_for_next_frame(self):
+        """Sleep until the next frame is due in realtime mode; never sleeps in max mode"""
+        if self.pace != 'realtime' or not self.fps:
+            return
+        now = time.monotonic()
+        if self._next_frame_time is None or self._next_frame_time < now - 1.0:
+            # First frame, or we fell far behind: restart the schedule instead of bursting
+            self._next_frame_time = now
+        elif self._next_frame_time > now:
+            time.sleep(self._next_frame_time - now)
+        self._next_frame_time += 1.0 / self.fps
+
+
+class DeviceSource(FrameSource):
+    """Local camera by index; probes the following indices if the configured one fails"""
+
+    def __init__(self, index=0, width=640, height=480, fps=30, probe_indices=4):
+        super().__init__()
+        self.index = index
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.probe_indices = probe_indices
+        self.capture = None
+        self.description = f'camera {index}'
+
+    def open(self):
+        # Simple camera initialization - avoid DirectShow which can cause issues
+        self.capture = cv2.VideoCapture(self.index)
+
+        # Check if camera opened successfully
+        if not self.capture.isOpened():
+            logger.error(f"Failed to open camera at index {self.index}")
+            # Try alternative camera indices
+            for i in range(self.index + 1, self.index + 1 + self.probe_indices):
+                logger.info(f"Trying camera index {i}")
+                self.capture = cv2.VideoCapture(i)
+                if self.capture is not None and self.capture.isOpened():
+                    logger.info(f"Camera opened successfully with index {i}")
+                    self.description = f'camera {i}'
+                    break
+
+        if not self.is_opened():
+            return False
+
+        # Optimize for performance with lower resolution
+        self.capture.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+        self.capture.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        self.capture.set(cv2.CAP_PROP_FPS, self.fps)
+
+        # Ultra-low latency settings
+        self.capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        # Don't force MJPEG - let camera use default codec
+        return True
+
+    def is_opened(self):
+        return self.capture is not None and self.capture.isOpened()
+
+    def read(self):
+        return self.capture.read()
+
+    def release(self):
+        if self.capture is not None:
+            self.capture.release()
+            self.capture = None
+
+
+class VideoFileSource(PacedSource):
+    """Frames of a recorded video file, paced by the file's own frame rate"""
+
+    def __init__(self, path, pace='realtime', loop=True, fps=None):
+        super().__init__(fps=fps, pace=pace, loop=loop)
+        self.path = path
+        self.capture = None
+        self.description = f'video {path}'
+
+    def open(self):
+        self.capture = cv2.VideoCapture(self.path)
+        if not self.capture.isOpened():
+            logger.error(f"Cannot open video {self.path}")
+            return False
+        if not self.fps:
+            self.fps = self.capture.get(cv2.CAP_PROP_FPS) or 30.0
+        return True
+
+    def is_opened(self):
+        return self.capture is not None and self.capture.isOpened()
+
+    def read(self):
+        self._wait_for_next_frame()
+        ret, frame = self.capture.read()
+        if not ret and self.loop:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.capture.read()
+        if not ret:
+            self.finished = True
+            self.release()
+        return ret, frame
+
+    def release(self):
+        if self.capture is not None:
+            self.capture.release()
+            self.capture = None
+
+
+class ImageDirectorySource(PacedSource):
+    """Images of a directory in name order, replayed as a video at ``fps``"""
+
+    def __init__(self, path, pace='realtime', loop=True, fps=10.0):
+        super().__init__(fps=fps, pace=pace, loop=loop)
+        self.path = path
+        self.files = None
+        self.position = 0
+        self.description = f'images {path}'
+
+    def open(self):
+        try:
+            self.files = [os.path.join(self.path, filename) for filename in sorted(os.listdir(self.path))
+                          if filename.lower().endswith(IMAGE_EXTENSIONS)]
+        except OSError as e:
+            logger.error(f"Cannot list image directory {self.path}: {e}")
+            self.files = None
+            return False
+        if not self.files:
+            logger.error(f"No images found in {self.path}")
+            self.files = None
+            return False
+        self.position = 0
+        return True
+
+    def is_opened(self):
+        return self.files is not None
+
+    def read(self):
+        self._wait_for_next_frame()
+        # Unreadable files are skipped; give up after one full pass without a frame
+        for _ in range(len(self.files)):
+            if self.position >= len(self.files):
+                if not self.loop:
+                    break
+                self.position = 0
+            filename = self.files[self.position]
+            self.position += 1
+            frame = cv2.imread(filename)
+            if frame is not None:
+                return True, frame
+            logger.warning(f"Skipping unreadable image {filename}")
+        self.finished = True
+        self.release()
+        return False, None
+
+    def release(self):
+        self.files = None
+
+
+class StreamSource(FrameSource):
+    """Network stream (RTSP, HTTP MJPEG, ...) opened by URL; reopened by the caller when it drops"""
+
+    def __init__(self, url):
+        super().__init__()
+        self.url = url
+        self.capture = None
+        self.description = f'stream {url}'
+
+    def open(self):
+        self.capture = cv2.VideoCapture(self.url)
+        if not self.capture.isOpened():
+            logger.error(f"Cannot open stream {self.url}")
+            return False
+        self.capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return True
+
+    def is_opened(self):
+        return self.capture is not None and self.capture.isOpened()
+
+    def read(self):
+        return self.capture.read()
+
+    def release(self):
+        if self.capture is not None:
+            self.capture.release()
+            self.capture = None
+
+
+class LoopbackSource(FrameSource):
+    """Stand-in for a network stream, delivering the frames of another source like a remote camera.
+
+    A producer thread reads the inner source at its own pace, whether or not
+    anyone consumes the frames, and sends each one in flight with a simulated
+    arrival time (``latency`` plus random ``jitter``, in seconds, never before
+    the previous frame). Frames move to the receive buffer once they have
+    arrived, so latency delays frames without lowering the frame rate. Like a
+    receive buffer, it only holds ``buffer_frames`` arrived frames and drops
+    the oldest when the consumer falls behind; at most ``max_in_flight``
+    frames are in transit, the oldest being lost beyond that.
+    """
+
+    def __init__(self, inner, latency=0.0, jitter=0.0, buffer_frames=2, max_in_flight=300):
+        super().__init__()
+        self.inner = inner
+        self.latency = latency
+        self.jitter = jitter
+        self.description = f'loopback of {inner.description}'
+        self._in_flight = deque(maxlen=max_in_flight)  # (arrival time, frame), in arrival order
+        self._frames = deque(maxlen=buffer_frames)     # arrived frames
+        self._last_arrival = 0.0
+        self._condition = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def open(self):
+        if not self.inner.open():
+            return False
+        self._running = True
+        self._thread = threading.Thread(target=self._produce, name="loopback-source", daemon=True)
+        self._thread.start()
+        return True
+
+    def _produce(self):
+        while self._running:
+            ret, frame = self.inner.read()
+            if not ret:
+                if self.inner.finished:
+                    break
+                time.sleep(0.1)
+                continue
+            arrival = time.monotonic() + self.latency + random.uniform(0.0, self.jitter)
+            with self._condition:
+                # Frames of one stream arrive in order
+                self._last_arrival = max(arrival, self._last_arrival)
+                self._in_flight.append((self._last_arrival, frame))
+                self._condition.notify_all()
+        with self._condition:
+            self._running = False
+            self.finished = self.inner.finished
+            self._condition.notify_all()
+
+    def is_opened(self):
+        return self._running or bool(self._frames) or bool(self._in_flight)
+
+    def _deliver(self, now):
+        """Move frames that have arrived by now into the receive buffer; called with the lock held"""
+        while self._in_flight and self._in_flight[0][0] <= now:
+            self._frames.append(self._in_flight.popleft()[1])
+
+    def read(self, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                self._deliver(now)
+                if self._frames:
+                    return True, self._frames.popleft()
+                if not self._running and not self._in_flight:
+                    return False, None
+                wait = deadline - now
+                if wait <= 0:
+                    return False, None
+                if self._in_flight:
+                    wait = min(wait, self._in_flight[0][0] - now)
+                self._condition.wait(wait)
+
+    def release(self):
+        self._running = False
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2.0)
+            self._thread = None
+        self.inner.release()
+        with self._condition:
+            self._frames.clear()
+            self._in_flight.clear()
+
+
+def create_frame_source(camera_config):
+    """Build the frame source described by the ``camera`` config section.
+
+    ``source`` selects the kind: ``device`` (default, uses ``index``),
+    ``video`` or ``images`` (use ``path``, ``pace`` and ``loop``), ``stream``
+    (uses ``url``) and ``loopback`` (replays ``path`` like a network stream
+    with ``loopback_latency_ms`` and ``loopback_jitter_ms``). Raises
+    ValueError for an unknown kind or a missing setting.
+    """
+    kind = camera_config.get('source', 'device')
+    pace = camera_config.get('pace', 'realtime')
+    loop = camera_config.get('loop', True)
+    if kind == 'device':
+        return DeviceSource(camera_config.get('index', 0), camera_config.get('width', 640),
+                            camera_config.get('height', 480), camera_config.get('fps', 30))
+    if kind == 'stream':
+        if not camera_config.get('url'):
+            raise ValueError("camera.url is required for a stream source")
+        return StreamSource(camera_config['url'])
+    if kind not in ('video', 'images', 'loopback'):
+        raise ValueError(f"Unknown frame source: {kind}")
+    path = camera_config.get('path')
+    if not path:
+        raise ValueError(f"camera.path is required for a {kind} source")
+    if kind == 'loopback':
+        # The inner source always runs in real time, like the remote camera it stands in for
+        inner = create_frame_source(dict(camera_config, source='images' if os.path.isdir(path) else 'video',
+                                         pace='realtime'))
+        return LoopbackSource(inner, camera_config.get('loopback_latency_ms', 0) / 1000.0,
+                              camera_config.get('loopback_jitter_ms', 0) / 1000.0)
+    if kind == 'images' or os.path.isdir(path):
+        return ImageDirectorySource(path, pace, loop, camera_config.get('fps', 10))
+    return VideoFileSource(path, pace, loop, camera_config.get('video_fps'))
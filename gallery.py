@@ -0,0 +1,448 @@
+#!/usr/bin/env python
+"""
+Versioned in-memory face gallery with vectorized matching for the Face Recognition System
+"""
+
+import threading
+import numpy as np
+
+from ann import kmeans
+
+ENCODING_SIZE = 128
+
+
+def key_source(key):
+    """Source part of an entry key, e.g. 'file:' for 'file:face_images/x.jpg' ('' for other keys)"""
+    if isinstance(key, str) and ':' in key:
+        return key[:key.index(':') + 1]
+    return ''
+
+
+def identity_prototypes(samples, count):
+    """Up to ``count`` centroids summarizing one identity's samples"""
+    if count == 1:
+        return samples.mean(axis=0, keepdims=True)
+    if len(samples) <= count:
+        return samples
+    return kmeans(np.ascontiguousarray(samples), count, iterations=5)
+
+
+class GallerySnapshot:
+    """Immutable view of the gallery at one version.
+
+    All encodings live in one contiguous float32 matrix with precomputed
+    squared norms, so matching all faces of a frame is a single matrix product.
+    Large galleries carry a view of the gallery's IVF index instead, and each
+    face is only compared with the lists closest to it. With identity
+    prototypes, faces are matched against the prototypes' snapshot first and
+    only the samples of the closest identities are compared exactly. Readers
+    just grab ``FaceGallery.snapshot`` and never need a lock.
+    """
+
+    def __init__(self, version, count, matrix, sq_norms, labels, alive, label_names, size, index=None,
+                 payloads=None, prototypes=None, rerank_margin=0.1):
+        self.version = version
+        self.size = size
+        self._count = count
+        self._matrix = matrix[:count]
+        self._sq_norms = sq_norms[:count]
+        self._labels = labels[:count]
+        self._alive = alive[:count]
+        self._payloads = payloads[:count] if payloads is not None else None
+        self._label_names = label_names
+        self._index = index
+        self._prototypes = prototypes
+        self._rerank_margin = rerank_margin
+        self._name_count = None
+
+    def __len__(self):
+        return self.size
+
+    def name_count(self):
+        """Number of distinct names, computed once per snapshot"""
+        if self._name_count is None:
+            labels = np.unique(self._labels[self._alive]).tolist()
+            self._name_count = len({self._label_names[label] for label in labels})
+        return self._name_count
+
+    def names(self):
+        """Names of all live entries"""
+        return [self._label_names[label] for label in self._labels[self._alive].tolist()]
+
+    @property
+    def indexed(self):
+        if self._prototypes is not None:
+            return self._prototypes.indexed
+        return self._index is not None
+
+    def nearest(self, queries, k=1):
+        """``(rows, distances)`` of the k closest live entries for each query, closest first"""
+        if self._index is not None:
+            return [self._index.search(query, self._alive, k) for query in queries]
+
+        # ||q - g||^2 = ||q||^2 + ||g||^2 - 2 q.g for all pairs at once
+        distances = queries @ self._matrix.T
+        distances *= -2.0
+        distances += self._sq_norms
+        distances += np.einsum('ij,ij->i', queries, queries)[:, None]
+        np.maximum(distances, 0.0, out=distances)
+        if self.size < self._count:
+            distances[:, ~self._alive] = np.inf
+
+        k = max(1, min(k, self.size))
+        if k == 1:
+            top = np.argmin(distances, axis=1)[:, None]
+        else:
+            top = np.argpartition(distances, k - 1, axis=1)[:, :k]
+            order = np.argsort(np.take_along_axis(distances, top, axis=1), axis=1)
+            top = np.take_along_axis(top, order, axis=1)
+        top_distances = np.sqrt(np.take_along_axis(distances, top, axis=1))
+        return list(zip(top, top_distances))
+
+    def match(self, face_encodings, k=1):
+        """Match a batch of encodings against the whole gallery.
+
+        Returns one list per input face holding up to ``k`` ``(name, distance)``
+        tuples, closest first. Distances are euclidean, like face_distance.
+        With an index the candidates are approximate, their distances exact.
+        With prototypes each name appears once, at the distance of its
+        closest sample.
+        """
+        queries = np.asarray(face_encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        if self.size == 0 or len(queries) == 0:
+            return [[] for _ in range(len(queries))]
+        if self._prototypes is not None:
+            return self._match_identities(queries, k)
+
+        return [[(self._label_names[label], distance)
+                 for label, distance in zip(self._labels[rows].tolist(), distances.tolist())]
+                for rows, distances in self.nearest(queries, k)]
+
+    def _match_identities(self, queries, k):
+        """First pass against the prototypes; samples of the identities within rerank_margin decide"""
+        prototypes = self._prototypes
+        results = []
+        for query, (rows, distances) in zip(queries, prototypes.nearest(queries, k + 4)):
+            members = {}
+            limit = distances[0] + self._rerank_margin if len(rows) else 0.0
+            for row, distance in zip(rows.tolist(), distances.tolist()):
+                name = prototypes._label_names[prototypes._labels[row]]
+                if name not in members and (distance <= limit or len(members) < k):
+                    members[name] = prototypes._payloads[row]
+            if not members:
+                results.append([])
+                continue
+
+            names = list(members)
+            sample_rows = np.concatenate([members[name] for name in names])
+            owners = np.repeat(np.arange(len(names)), [len(members[name]) for name in names])
+            diff = self._matrix[sample_rows] - query
+            best = np.full(len(names), np.inf)
+            np.minimum.at(best, owners, np.einsum('ij,ij->i', diff, diff))
+            order = np.argsort(best)[:k]
+            results.append([(names[i], float(np.sqrt(best[i]))) for i in order.tolist()])
+        return results
+
+    def best_match(self, face_encodings, tolerance=0.6):
+        """Return ``(name, confidence)`` per face, "Unknown" when nothing is within tolerance"""
+        results = []
+        for candidates in self.match(face_encodings, k=1):
+            if candidates and candidates[0][1] <= tolerance:
+                name, distance = candidates[0]
+                results.append((name, 1 - distance))
+            else:
+                results.append(("Unknown", 0.0))
+        return results
+
+
+class FaceGallery:
+    """Copy-on-write store of known faces, published as versioned snapshots.
+
+    Each entry has a unique key (e.g. ``db:12`` or ``file:face_images/x.jpg``)
+    and a name. Rows are appended past the end of every published snapshot, so
+    adding is O(1) amortized; removing copies only the per-row alive flags and
+    renaming only the label table. Each edit publishes a new snapshot with one
+    atomic rebind. Dead rows are compacted away once they make up half of the
+    buffer.
+
+    With an ``index`` (an ann.IVFIndex) the gallery trains it once it holds
+    ``index.min_size`` entries, keeps it up to date on every edit and
+    publishes a view of it with each snapshot.
+
+    Entries sharing a name are samples of one identity. ``max_samples`` keeps
+    only that many of the newest samples per identity. With ``prototypes``
+    set, each identity is also summarized by up to that many centroids, kept
+    in an inner gallery (which gets the index), so matching scales with the
+    number of identities rather than samples; every sample still counts
+    when a face is close to several identities.
+    """
+
+    def __init__(self, initial_capacity=256, index=None, max_samples=None, prototypes=0, rerank_margin=0.1):
+        self._write_lock = threading.Lock()
+        self._matrix = np.zeros((initial_capacity, ENCODING_SIZE), dtype=np.float32)
+        self._sq_norms = np.zeros(initial_capacity, dtype=np.float32)
+        self._labels = np.zeros(initial_capacity, dtype=np.int32)
+        self._alive = np.zeros(initial_capacity, dtype=bool)
+        self._payloads = np.empty(initial_capacity, dtype=object)
+        self._label_names = []
+        self._label_ids = {}  # name -> label
+        self._key_rows = {}   # key -> row
+        self._name_keys = {}  # name -> keys, oldest first
+        self._source_keys = {}  # key_source(key) -> keys, so sync only visits its own source
+        self._evicted = set() # keys dropped by max_samples, so sync does not bring them back
+        self._dirty_names = set()
+        self._count = 0
+        self._version = 0
+        self.max_samples = max_samples
+        self.prototypes = prototypes
+        self.rerank_margin = rerank_margin
+        self._prototype_gallery = None
+        self._prototype_counts = {}  # name -> prototypes in the inner gallery
+        if prototypes:
+            self._prototype_gallery = FaceGallery(initial_capacity, index=index)
+            index = None
+        self._index = index
+        self.snapshot = self._snapshot()
+
+    def __len__(self):
+        return self.snapshot.size
+
+    def _snapshot(self):
+        index = self._index
+        view = None
+        if index is not None and index.trained and len(self._key_rows) >= index.min_size:
+            view = index.view()
+        prototypes = self._prototype_gallery.snapshot if self._prototype_gallery is not None else None
+        return GallerySnapshot(self._version, self._count, self._matrix, self._sq_norms, self._labels,
+                               self._alive, self._label_names, len(self._key_rows), view,
+                               self._payloads, prototypes, self.rerank_margin)
+
+    def _update_index(self):
+        """Index the rows appended since the last snapshot, (re)training the index when it is due"""
+        index = self._index
+        if index is None:
+            return
+        if index.needs_training(len(self._key_rows)):
+            live_rows = np.array(sorted(self._key_rows.values()), dtype=np.int64)
+            index.train(self._matrix[live_rows])
+            index.build(self._matrix[:self._count])
+        elif index.trained:
+            index.add(self._matrix[index.size:self._count])
+
+    def _enforce_max_samples(self):
+        if not self.max_samples:
+            return
+        evicted = []
+        for name in self._dirty_names:
+            keys = self._name_keys.get(name, [])
+            if len(keys) > self.max_samples:
+                evicted.extend(keys[:len(keys) - self.max_samples])
+        if evicted:
+            self._evicted.update(evicted)
+            self._drop(evicted)
+
+    def _update_prototypes(self):
+        """Recompute the prototypes of every identity whose samples changed"""
+        if self._prototype_gallery is None:
+            self._dirty_names = set()
+            return
+        entries, removed = [], []
+        for name in self._dirty_names:
+            rows = np.array([self._key_rows[key] for key in self._name_keys.get(name, ())], dtype=np.int64)
+            centroids = identity_prototypes(self._matrix[rows], self.prototypes) if len(rows) else ()
+            # The rows of its samples travel with each prototype for re-ranking
+            entries.extend(((name, i), name, centroid, rows) for i, centroid in enumerate(centroids))
+            removed.extend((name, i) for i in range(len(centroids), self._prototype_counts.get(name, 0)))
+            if len(centroids):
+                self._prototype_counts[name] = len(centroids)
+            else:
+                self._prototype_counts.pop(name, None)
+        self._dirty_names = set()
+        self._prototype_gallery._replace(entries, removed)
+
+    def _publish(self):
+        self._enforce_max_samples()
+        self._update_index()
+        self._update_prototypes()
+        self._version += 1
+        self.snapshot = self._snapshot()
+        return self.snapshot
+
+    def _grow(self, needed):
+        capacity = self._matrix.shape[0]
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        # New buffers; snapshots still holding the old ones stay consistent
+        for attr in ('_matrix', '_sq_norms', '_labels', '_alive', '_payloads'):
+            old = getattr(self, attr)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self._count] = old[:self._count]
+            setattr(self, attr, new)
+
+    def _label_for(self, name):
+        label = self._label_ids.get(name)
+        if label is None:
+            label = len(self._label_names)
+            # Appending is invisible to published snapshots, which only index known labels
+            self._label_names.append(name)
+            self._label_ids[name] = label
+        return label
+
+    def _append(self, key, name, encoding, payload=None):
+        row = self._count
+        self._grow(row + 1)
+        encoding = np.asarray(encoding, dtype=np.float32).reshape(ENCODING_SIZE)
+        self._matrix[row] = encoding
+        self._sq_norms[row] = np.dot(encoding, encoding)
+        self._labels[row] = self._label_for(name)
+        self._alive[row] = True
+        self._payloads[row] = payload
+        self._key_rows[key] = row
+        self._name_keys.setdefault(name, []).append(key)
+        self._source_keys.setdefault(key_source(key), set()).add(key)
+        self._dirty_names.add(name)
+        self._count += 1
+
+    def _drop(self, keys):
+        """Remove entries by key, without publishing"""
+        rows = []
+        for key in keys:
+            row = self._key_rows.pop(key, None)
+            if row is None:
+                continue
+            self._source_keys[key_source(key)].discard(key)
+            rows.append(row)
+            name = self._label_names[self._labels[row]]
+            name_keys = self._name_keys[name]
+            name_keys.remove(key)
+            if not name_keys:
+                del self._name_keys[name]
+            self._dirty_names.add(name)
+        self._kill(rows)
+        return rows
+
+    def _kill(self, rows):
+        if not rows:
+            return
+        # Copy-on-write: published snapshots keep their own alive flags
+        self._alive = self._alive.copy()
+        self._alive[rows] = False
+        if self._count >= 64 and len(self._key_rows) * 2 < self._count:
+            self._compact()
+
+    def _compact(self):
+        if self._index is not None and self._index.trained:
+            # Rows appended in this edit must be indexed before they are renumbered
+            self._index.add(self._matrix[self._index.size:self._count])
+        live = sorted(self._key_rows.items(), key=lambda item: item[1])
+        rows = np.array([row for _, row in live], dtype=np.int64)
+        capacity = max(self._matrix.shape[0] // 2, len(rows), 1)
+        matrix = np.zeros((capacity, ENCODING_SIZE), dtype=np.float32)
+        sq_norms = np.zeros(capacity, dtype=np.float32)
+        labels = np.zeros(capacity, dtype=np.int32)
+        alive = np.zeros(capacity, dtype=bool)
+        payloads = np.empty(capacity, dtype=object)
+        matrix[:len(rows)] = self._matrix[rows]
+        sq_norms[:len(rows)] = self._sq_norms[rows]
+        labels[:len(rows)] = self._labels[rows]
+        alive[:len(rows)] = True
+        payloads[:len(rows)] = self._payloads[rows]
+        self._matrix, self._sq_norms, self._labels, self._alive = matrix, sq_norms, labels, alive
+        self._payloads = payloads
+        self._key_rows = {key: new_row for new_row, (key, _) in enumerate(live)}
+        self._count = len(rows)
+        if self._index is not None and self._index.trained:
+            self._index.compact(rows, self._matrix[:self._count])
+        # Prototypes refer to sample rows, which were just renumbered
+        self._dirty_names.update(self._name_keys)
+
+    def _replace(self, entries, removed):
+        """Add ``(key, name, encoding, payload)`` entries and remove keys in one new snapshot"""
+        with self._write_lock:
+            self._drop([key for key, _, _, _ in entries] + list(removed))
+            for key, name, encoding, payload in entries:
+                self._append(key, name, encoding, payload)
+            return self._publish()
+
+    def add(self, key, name, encoding):
+        """Add (or replace) one entry and publish a new snapshot"""
+        return self.add_many([(key, name, encoding)])
+
+    def add_many(self, entries):
+        """Add (or replace) ``(key, name, encoding)`` entries in one new snapshot"""
+        with self._write_lock:
+            self._drop([key for key, _, _ in entries])
+            for key, name, encoding in entries:
+                self._evicted.discard(key)
+                self._append(key, name, encoding)
+            return self._publish()
+
+    def _remove_keys(self, keys):
+        if not self._drop(keys):
+            return self.snapshot
+        return self._publish()
+
+    def remove(self, keys):
+        """Remove entries by key"""
+        with self._write_lock:
+            self._evicted.difference_update(keys)
+            return self._remove_keys(keys)
+
+    def remove_names(self, names):
+        """Remove every entry whose name is in names"""
+        with self._write_lock:
+            return self._remove_keys([key for name in set(names) for key in self._name_keys.get(name, ())])
+
+    def rename(self, old_name, new_name):
+        """Rename every entry called old_name"""
+        with self._write_lock:
+            old_keys = self._name_keys.get(old_name)
+            if not old_keys or old_name == new_name:
+                return self.snapshot
+            labels = {int(self._labels[self._key_rows[key]]) for key in old_keys}
+            # Copy-on-write of the label table only; encodings are untouched
+            self._label_names = list(self._label_names)
+            for label in labels:
+                self._label_names[label] = new_name
+            self._label_ids.pop(old_name, None)
+            self._label_ids.setdefault(new_name, min(labels))
+            # The renamed samples join new_name's, oldest first
+            keys = self._name_keys.pop(old_name) + self._name_keys.get(new_name, [])
+            self._name_keys[new_name] = sorted(keys, key=self._key_rows.get)
+            self._dirty_names.update((old_name, new_name))
+            return self._publish()
+
+    def sync(self, prefix, entries):
+        """Make the entries whose key starts with prefix match ``entries`` exactly.
+
+        Only the keys of prefix's source are visited and unchanged entries are
+        left alone, so reloading a source costs O(its entries) and edits
+        O(changed items), however large the other sources are. Entries dropped
+        by max_samples stay dropped.
+        """
+        with self._write_lock:
+            wanted = {key: (name, encoding) for key, name, encoding in entries}
+            self._evicted = {key for key in self._evicted if not key.startswith(prefix) or key in wanted}
+            for key in self._evicted.intersection(wanted):
+                del wanted[key]
+            stale = []
+            for key in self._source_keys.get(key_source(prefix), ()):
+                if not key.startswith(prefix):
+                    continue
+                row = self._key_rows[key]
+                entry = wanted.get(key)
+                if entry is None:
+                    stale.append(key)
+                elif (self._label_names[self._labels[row]] == entry[0]
+                      and np.array_equal(self._matrix[row], np.asarray(entry[1], dtype=np.float32))):
+                    del wanted[key]
+                else:
+                    stale.append(key)
+            if not stale and not wanted:
+                return self.snapshot
+            self._drop(stale)
+            for key, (name, encoding) in wanted.items():
+                self._append(key, name, encoding)
+            return self._publish()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+"""
+In-memory rolling aggregates of recognition events for the live dashboard
+"""
+
+import threading
+import time
+from collections import deque
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class RecognitionStats:
+    """Time-bucketed counters fed by the recognition pipeline.
+
+    Every logged recognition lands in a per-second ring covering
+    ``window_seconds`` plus short lists for the recent-detections feed and the
+    active-faces panel. Running totals are kept next to the ring, so the live
+    endpoints answer without scanning it and without touching the database.
+    """
+
+    def __init__(self, window_seconds=3600, high_confidence=0.5, recent_seconds=30, recent_limit=10,
+                 active_seconds=10, active_min_confidence=0.6):
+        self.window_seconds = window_seconds
+        self.high_confidence = high_confidence
+        self.recent_seconds = recent_seconds
+        self.active_seconds = active_seconds
+        self.active_min_confidence = active_min_confidence
+        self.lock = threading.Lock()
+        self._totals = [0] * window_seconds
+        self._high = [0] * window_seconds
+        self._total_sum = 0
+        self._high_sum = 0
+        self._head = int(time.time())  # newest second the ring has been advanced to
+        self._recent = deque(maxlen=recent_limit)  # (time, name, confidence, timestamp)
+        self._active = deque()                     # (time, name, confidence)
+
+    def _advance(self, second):
+        """Clear the buckets that fell out of the window since the last call"""
+        if second <= self._head:
+            return
+        if second - self._head >= self.window_seconds:
+            self._totals = [0] * self.window_seconds
+            self._high = [0] * self.window_seconds
+            self._total_sum = 0
+            self._high_sum = 0
+        else:
+            for s in range(self._head + 1, second + 1):
+                slot = s % self.window_seconds
+                self._total_sum -= self._totals[slot]
+                self._high_sum -= self._high[slot]
+                self._totals[slot] = 0
+                self._high[slot] = 0
+        self._head = second
+
+    def _prune_active(self, now):
+        while self._active and now - self._active[0][0] > self.active_seconds:
+            self._active.popleft()
+
+    def record(self, name, confidence, now=None):
+        """Count one logged recognition; returns its timestamp string"""
+        now = time.time() if now is None else now
+        second = int(now)
+        with self.lock:
+            self._advance(second)
+            if self._head - second < self.window_seconds:
+                slot = second % self.window_seconds
+                self._totals[slot] += 1
+                self._total_sum += 1
+                if confidence > self.high_confidence:
+                    self._high[slot] += 1
+                    self._high_sum += 1
+            timestamp = time.strftime(TIMESTAMP_FORMAT, time.gmtime(now))
+            self._recent.appendleft((now, name, confidence, timestamp))
+            if confidence > self.active_min_confidence:
+                self._active.append((now, name, confidence))
+                self._prune_active(now)
+        return timestamp
+
+    def seed(self, events):
+        """Fill the counters from ``(name, confidence, unix_time)`` events, oldest first"""
+        for name, confidence, event_time in events:
+            self.record(name, confidence, now=event_time)
+
+    def recognition_rate(self, now=None):
+        """Percentage of recognitions in the window above ``high_confidence``"""
+        now = time.time() if now is None else now
+        with self.lock:
+            self._advance(int(now))
+            if self._total_sum == 0:
+                return 0.0
+            return self._high_sum * 100.0 / self._total_sum
+
+    def recent_detections(self, now=None):
+        """Newest logged recognitions of the last ``recent_seconds`` as ``[name, confidence, timestamp]``"""
+        now = time.time() if now is None else now
+        with self.lock:
+            return [[name, confidence, timestamp] for event_time, name, confidence, timestamp in self._recent
+                    if now - event_time <= self.recent_seconds]
+
+    def active_faces(self, now=None):
+        """``[name, max confidence, count]`` per name seen in the last ``active_seconds``, most confident first"""
+        now = time.time() if now is None else now
+        with self.lock:
+            self._prune_active(now)
+            faces = {}
+            for _, name, confidence in self._active:
+                best, count = faces.get(name, (0.0, 0))
+                faces[name] = (max(best, confidence), count + 1)
+        return sorted(([name, best, count] for name, (best, count) in faces.items()),
+                      key=lambda face: face[1], reverse=True)
+
+    def rename(self, old_name, new_name):
+        """Follow a rename of a person in the recent lists"""
+        with self.lock:
+            self._recent = deque(((t, new_name if name == old_name else name, confidence, timestamp)
+                                  for t, name, confidence, timestamp in self._recent), maxlen=self._recent.maxlen)
+            self._active = deque((t, new_name if name == old_name else name, confidence)
+                                 for t, name, confidence in self._active)
+
+    def forget(self, names):
+        """Drop deleted people from the recent lists"""
+        names = set(names)
+        with self.lock:
+            self._recent = deque((event for event in self._recent if event[1] not in names),
+                                 maxlen=self._recent.maxlen)
+            self._active = deque(event for event in self._active if event[1] not in names)
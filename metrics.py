@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+"""
+Counters, gauges and latency histograms exported in the Prometheus text format
+"""
+
+import math
+import threading
+
+# Seconds; spans a sub-millisecond resize up to a slow CNN detection
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values)) + (extra or [])
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """``(suffix, label values, extra labels, value)`` for every series"""
+        with self._lock:
+            return [('', key, None, value) for key, value in sorted(self._values.items())]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, key, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{format_labels(self.labelnames, key, extra)} {format_value(value)}")
+        return '\n'.join(lines)
+
+    def as_dict(self):
+        return {'type': self.kind, 'help': self.help,
+                'values': [dict(zip(self.labelnames, key), value=value) for _, key, _, value in self.samples()]}
+
+
+class Counter(Metric):
+    """Monotonic count, e.g. frames captured"""
+
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Current value; either set directly or read from ``collect`` at scrape time.
+
+    ``collect`` returns a number for an unlabelled gauge, or a dict mapping
+    label value tuples to numbers. Counters owned by other components (e.g.
+    the recognition stage) are exported the same way with ``kind='counter'``.
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, labelnames=(), collect=None, kind=None):
+        super().__init__(name, help_text, labelnames)
+        self.collect = collect
+        if kind is not None:
+            self.kind = kind
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self):
+        if self.collect is None:
+            return super().samples()
+        values = self.collect()
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [('', tuple(str(v) for v in key), None, value) for key, value in sorted(values.items())]
+
+
+class Histogram(Metric):
+    """Latency distribution with cumulative buckets, a sum and a count per label set"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            series[1] += value
+            series[2] += 1
+
+    def _snapshot(self):
+        with self._lock:
+            return sorted((key, list(counts), total, count) for key, (counts, total, count) in self._values.items())
+
+    def samples(self):
+        samples = []
+        for key, counts, total, count in self._snapshot():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                samples.append(('_bucket', key, [('le', format_value(float(bound)))], cumulative))
+            samples.append(('_sum', key, None, total))
+            samples.append(('_count', key, None, count))
+        return samples
+
+    def as_dict(self):
+        values = []
+        for key, counts, total, count in self._snapshot():
+            cumulative = 0
+            buckets = []  # [upper bound, cumulative count], in bound order
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                buckets.append([format_value(float(bound)), cumulative])
+            values.append(dict(zip(self.labelnames, key), count=count, sum=total,
+                               mean=total / count if count else None, buckets=buckets))
+        return {'type': self.kind, 'help': self.help, 'values': values}
+
+
+class MetricsRegistry:
+    """Named metrics of one process, rendered for /metrics"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name, help_text, labelnames=(), collect=None, kind=None):
+        return self._register(Gauge(name, help_text, labelnames, collect, kind))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self):
+        """Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+    def as_dict(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.as_dict() for metric in metrics}
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+"""
+Motion regions from background subtraction, used to gate face detection
+"""
+
+import time
+
+import cv2
+import numpy as np
+
+
+class MotionDetector:
+    """Finds the parts of a frame that changed against a slowly adapting background.
+
+    ``regions`` is fed the downscaled frames that are about to be sent to
+    recognition and returns ``(top, right, bottom, left)`` boxes in the same
+    coordinates, or an empty list when the scene is static. The background is
+    a running average, so lighting drifts and people who stop moving blend in
+    after a while; ``full_scan_seconds`` forces a full frame now and then
+    (returns None) so nobody is missed for long.
+    """
+
+    def __init__(self, threshold=25, min_area=0.002, learning_rate=0.05, padding=0.25, blur=5,
+                 full_scan_seconds=10.0):
+        self.threshold = threshold
+        self.min_area = min_area  # fraction of the frame
+        self.learning_rate = learning_rate
+        self.padding = padding
+        self.blur = blur | 1
+        self.full_scan_seconds = full_scan_seconds
+        self._background = None
+        self._last_full_scan = 0.0
+        self._kernel = np.ones((3, 3), dtype=np.uint8)
+
+    def reset(self):
+        self._background = None
+
+    def regions(self, frame, now=None):
+        """Motion boxes of a BGR frame; None means scan the whole frame"""
+        now = time.time() if now is None else now
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        gray = cv2.GaussianBlur(gray, (self.blur, self.blur), 0)
+
+        if self._background is None or self._background.shape != gray.shape:
+            # Nothing to compare against yet
+            self._background = gray.astype(np.float32)
+            self._last_full_scan = now
+            return None
+
+        diff = cv2.absdiff(gray, cv2.convertScaleAbs(self._background))
+        cv2.accumulateWeighted(gray, self._background, self.learning_rate)
+        if self.full_scan_seconds and now - self._last_full_scan >= self.full_scan_seconds:
+            self._last_full_scan = now
+            return None
+
+        _, mask = cv2.threshold(diff, self.threshold, 255, cv2.THRESH_BINARY)
+        mask = cv2.dilate(mask, self._kernel, iterations=2)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        height, width = gray.shape
+        min_area = self.min_area * height * width
+        boxes = []
+        for contour in contours:
+            if cv2.contourArea(contour) < min_area:
+                continue
+            x, y, w, h = cv2.boundingRect(contour)
+            pad_x, pad_y = int(w * self.padding), int(h * self.padding)
+            boxes.append((max(0, y - pad_y), min(width, x + w + pad_x), min(height, y + h + pad_y), max(0, x - pad_x)))
+        return boxes
@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+"""
+Drawing of recognition results onto video frames
+"""
+
+import cv2
+
+
+def draw_faces(frame, faces):
+    """Draw a labelled box for every face dict (location, name, confidence) onto frame in place"""
+    for face_info in faces:
+        top, right, bottom, left = face_info['location']
+        name = face_info['name']
+        confidence = face_info['confidence']
+
+        # Choose color based on recognition
+        if name != "Unknown":
+            color = (0, 255, 0)  # Green for known faces
+        else:
+            color = (0, 0, 255)  # Red for unknown faces
+
+        # Draw rectangle and name
+        cv2.rectangle(frame, (left, top), (right, bottom), color, 2)
+        cv2.rectangle(frame, (left, bottom - 35), (right, bottom), color, cv2.FILLED)
+
+        # Format text
+        if confidence > 0:
+            text = f"{name} ({confidence:.2f})"
+        else:
+            text = name
+
+        font = cv2.FONT_HERSHEY_DUPLEX
+        cv2.putText(frame, text, (left + 6, bottom - 6), font, 0.6, (255, 255, 255), 1)
@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+"""
+Named performance profiles for the video pipeline, switchable at runtime
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+from recognition import HOG_WINDOW
+
+logger = logging.getLogger(__name__)
+
+# Profile setting -> (type, validity check, description used in error messages)
+PROFILE_FIELDS = {
+    'resize_factor': (float, lambda v: 0 < v <= 1, "between 0 and 1"),
+    'model': (str, lambda v: v in ('hog', 'cnn'), "'hog' or 'cnn'"),
+    'number_of_times_to_upsample': (int, lambda v: 0 <= v <= 3, "between 0 and 3"),
+    'max_faces': (int, lambda v: v >= 1, "at least 1"),
+    'tolerance': (float, lambda v: 0 < v <= 1, "between 0 and 1"),
+    'min_face_size': (int, lambda v: v >= 0, "at least 0"),
+    'max_face_size': (int, lambda v: v >= 1, "at least 1"),
+    'target_fps': (float, lambda v: 1 <= v <= 60, "between 1 and 60"),
+    'jpeg_quality': (int, lambda v: 10 <= v <= 100, "between 10 and 100"),
+    'prefilter': (bool, lambda v: True, "true or false"),
+}
+
+DEFAULT_PROFILE = {
+    'resize_factor': 0.25,
+    'model': 'hog',
+    'number_of_times_to_upsample': 0,
+    'max_faces': 3,
+    'tolerance': 0.6,
+    'min_face_size': 0,
+    'max_face_size': 10000,
+    'target_fps': 25.0,
+    'jpeg_quality': 80,
+    'prefilter': False,
+}
+
+
+def validate_profile(values):
+    """Check and coerce profile settings; raises ValueError naming the offending setting"""
+    if not isinstance(values, dict):
+        raise ValueError("Profile must be an object")
+    validated = {}
+    for key, value in values.items():
+        if key not in PROFILE_FIELDS:
+            raise ValueError(f"Unknown profile setting: {key}")
+        kind, check, expected = PROFILE_FIELDS[key]
+        try:
+            if isinstance(value, bool) != (kind is bool) or (kind is not str and isinstance(value, str)):
+                raise TypeError
+            if kind is int and isinstance(value, float) and not value.is_integer():
+                raise TypeError
+            value = kind(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{key} must be a {kind.__name__}")
+        if not check(value):
+            raise ValueError(f"{key} must be {expected}")
+        validated[key] = value
+    return validated
+
+
+def smallest_face_size(profile):
+    """Smallest face (full-frame pixels) the profile's detector finds, or 0 when unknown"""
+    if profile['model'] != 'hog':
+        return 0
+    return HOG_WINDOW / (profile['resize_factor'] * 2 ** profile['number_of_times_to_upsample'])
+
+
+def face_size_problem(profile):
+    """Why the face size limits (full-frame pixels) would filter out every face, or None if they are usable"""
+    if profile['min_face_size'] > profile['max_face_size']:
+        return "min_face_size must not exceed max_face_size"
+    smallest = smallest_face_size(profile)
+    if profile['max_face_size'] < smallest:
+        return (f"max_face_size must be at least {smallest:.0f}, the smallest face HOG detects "
+                f"at this resize_factor and upsampling")
+    return None
+
+
+def warn_unused_min_face_size(profile, label):
+    """A min_face_size below the smallest detectable face filters nothing; harmless, so only logged"""
+    smallest = smallest_face_size(profile)
+    if 0 < profile['min_face_size'] < smallest:
+        logger.warning(f"{label}: min_face_size {profile['min_face_size']} filters nothing, HOG detects no face "
+                       f"smaller than {smallest:.0f} at this resize_factor and upsampling")
+
+
+def check_face_size_range(profile, label):
+    """Raise ValueError for face size limits that filter out every face"""
+    problem = face_size_problem(profile)
+    if problem:
+        raise ValueError(problem)
+    warn_unused_min_face_size(profile, label)
+    return profile
+
+
+def fix_face_size_range(profile, fallback, label):
+    """Replace unusable face size limits with the fallback's (or the defaults') and warn, for config loading"""
+    problem = face_size_problem(profile)
+    if not problem:
+        warn_unused_min_face_size(profile, label)
+        return profile
+    for limits in (fallback, DEFAULT_PROFILE):
+        fixed = dict(profile, min_face_size=limits['min_face_size'], max_face_size=limits['max_face_size'])
+        if not face_size_problem(fixed):
+            break
+    logger.warning(f"{label}: {problem}; using min_face_size {fixed['min_face_size']} "
+                   f"and max_face_size {fixed['max_face_size']}")
+    warn_unused_min_face_size(fixed, label)
+    return fixed
+
+
+class PipelineProfile:
+    """Immutable set of hot-path settings; the pipeline reads one per frame"""
+
+    def __init__(self, name, values):
+        self.name = name
+        for key in PROFILE_FIELDS:
+            setattr(self, key, values[key])
+
+    def as_dict(self):
+        return {key: getattr(self, key) for key in PROFILE_FIELDS}
+
+
+class ProfileManager:
+    """Holds the named profiles and publishes the active one as ``current``.
+
+    Profiles are built from the ``pipeline_profiles`` section of the config on
+    top of the base settings. Switching or editing a profile rebinds
+    ``current`` atomically, so the video loop picks the change up on its next
+    frame without a lock or a restart. ``reload_if_changed`` re-reads the
+    config file when it is modified; the file's profiles and active profile
+    then replace any runtime edits.
+    """
+
+    def __init__(self, config, config_path='config.json', check_interval=2.0):
+        self.config_path = config_path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._config_mtime = self._mtime()
+        self._last_check = time.time()
+        self._load(config)
+
+    def _mtime(self):
+        try:
+            return os.stat(self.config_path).st_mtime_ns
+        except OSError:
+            return None
+
+    @staticmethod
+    def base_settings(config):
+        """Settings every profile inherits from the face_recognition and performance sections"""
+        face_config = config.get('face_recognition', {})
+        perf_config = config.get('performance', {})
+        base = dict(DEFAULT_PROFILE)
+        for key in ('resize_factor', 'model', 'number_of_times_to_upsample', 'tolerance',
+                    'min_face_size', 'max_face_size'):
+            if key in face_config:
+                base[key] = face_config[key]
+        if 'max_faces_per_frame' in perf_config:
+            base['max_faces'] = perf_config['max_faces_per_frame']
+        if 'jpeg_quality' in perf_config:
+            base['jpeg_quality'] = perf_config['jpeg_quality']
+        if 'enabled' in face_config.get('prefilter', {}):
+            base['prefilter'] = face_config['prefilter']['enabled']
+        return fix_face_size_range(validate_profile(base), DEFAULT_PROFILE, "Base face size limits")
+
+    def _load(self, config):
+        section = config.get('pipeline_profiles', {})
+        base = self.base_settings(config)
+        profiles = {'default': base}
+        for name, values in section.get('profiles', {}).items():
+            try:
+                profiles[name] = fix_face_size_range(dict(base, **validate_profile(values)), base,
+                                                     f"Pipeline profile '{name}'")
+            except ValueError as e:
+                logger.error(f"Ignoring invalid pipeline profile '{name}': {e}")
+        active = section.get('active', 'default')
+        if active not in profiles:
+            logger.warning(f"Pipeline profile '{active}' not found, using 'default'")
+            active = 'default'
+        with self._lock:
+            self._base = base
+            self._profiles = profiles
+            self.current = PipelineProfile(active, profiles[active])
+        logger.info(f"Pipeline profile '{active}' active ({len(profiles)} profiles loaded)")
+
+    def reload_if_changed(self, now=None):
+        """Re-read the config file if it changed; cheap enough to call once per frame"""
+        now = time.time() if now is None else now
+        if now - self._last_check < self.check_interval:
+            return False
+        self._last_check = now
+        mtime = self._mtime()
+        if mtime is None or mtime == self._config_mtime:
+            return False
+        self._config_mtime = mtime
+        try:
+            with open(self.config_path, 'r') as f:
+                config = json.load(f)
+            self._load(config)
+            return True
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to reload pipeline profiles from {self.config_path}: {e}")
+            return False
+
+    def as_dict(self):
+        with self._lock:
+            return {'active': self.current.name,
+                    'profiles': {name: dict(values) for name, values in self._profiles.items()}}
+
+    def activate(self, name):
+        """Make the named profile current; raises KeyError if it does not exist"""
+        with self._lock:
+            if name not in self._profiles:
+                raise KeyError(name)
+            self.current = PipelineProfile(name, self._profiles[name])
+        logger.info(f"Switched to pipeline profile '{name}'")
+        return self.current
+
+    def update(self, name, values):
+        """Create or edit a profile; unspecified settings keep their value (or the base value)"""
+        values = validate_profile(values)
+        with self._lock:
+            profile = check_face_size_range(dict(self._profiles.get(name, self._base), **values),
+                                            f"Pipeline profile '{name}'")
+            self._profiles = dict(self._profiles, **{name: profile})
+            if self.current.name == name:
+                self.current = PipelineProfile(name, profile)
+        logger.info(f"Updated pipeline profile '{name}'")
+        return profile
+
+    def delete(self, name):
+        """Remove a profile; the active profile and 'default' cannot be removed"""
+        with self._lock:
+            if name not in self._profiles:
+                raise KeyError(name)
+            if name == 'default' or name == self.current.name:
+                raise ValueError(f"Cannot delete profile '{name}' while it is active or built in")
+            self._profiles = {key: value for key, value in self._profiles.items() if key != name}
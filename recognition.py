@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+"""
+Asynchronous face detection and encoding in a pool of worker processes
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import face_recognition
+import numpy as np
+
+from tracker import box_iou
+
+logger = logging.getLogger(__name__)
+
+HAAR_CASCADE_FILE = 'haarcascade_frontalface_default.xml'
+
+# dlib's HOG detection window: the smallest face it finds, in pixels of the image it scans (halved per
+# upsample); a region smaller than this cannot hold a face
+HOG_WINDOW = 80
+
+# Scan the whole frame once when the regions to scan cover at least this fraction of it
+FULL_SCAN_COVERAGE = 0.6
+
+# Haar prefilter settings; candidates are padded so dlib sees the whole face
+DEFAULT_PREFILTER = {
+    'scale_factor': 1.1,
+    'min_neighbors': 3,
+    'min_size': 20,
+    'padding': 0.5,
+    'min_region': HOG_WINDOW,
+}
+
+_cascade = None
+_cascade_failed = False
+
+
+def get_cascade():
+    """The OpenCV frontal face cascade, loaded once per process; None if it is not available"""
+    global _cascade, _cascade_failed
+    if _cascade is None and not _cascade_failed:
+        path = os.path.join(getattr(getattr(cv2, 'data', None), 'haarcascades', ''), HAAR_CASCADE_FILE)
+        try:
+            cascade = cv2.CascadeClassifier(path)
+            loaded = not cascade.empty()
+        except (AttributeError, cv2.error):
+            # OpenCV builds without the objdetect module
+            loaded = False
+        if loaded:
+            _cascade = cascade
+        else:
+            logger.warning(f"Haar cascade {path} not available, prefilter disabled")
+            _cascade_failed = True
+    return _cascade
+
+
+def init_worker():
+    """Warm up the dlib models once per worker process"""
+    blank = np.zeros((64, 64, 3), dtype=np.uint8)
+    face_recognition.face_locations(blank)
+    face_recognition.face_encodings(blank, [(0, 63, 63, 0)])
+    get_cascade()
+
+
+def pad_region(region, padding, min_region, height, width):
+    """Grow a (top, right, bottom, left) box by ``padding`` of its size, to at least min_region, within the frame"""
+    top, right, bottom, left = (int(v) for v in region)
+    box_height, box_width = bottom - top, right - left
+    pad_y = max(int(box_height * padding), (min_region - box_height + 1) // 2)
+    pad_x = max(int(box_width * padding), (min_region - box_width + 1) // 2)
+    return [max(0, top - pad_y), min(width, right + pad_x), min(height, bottom + pad_y), max(0, left - pad_x)]
+
+
+def merge_regions(regions):
+    """Merge overlapping (top, right, bottom, left) regions so no face is scanned (and reported) twice"""
+    regions = [list(region) for region in regions]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(regions)):
+            for j in range(i + 1, len(regions)):
+                a, b = regions[i], regions[j]
+                if a[0] < b[2] and b[0] < a[2] and a[3] < b[1] and b[3] < a[1]:
+                    regions[i] = [min(a[0], b[0]), max(a[1], b[1]), max(a[2], b[2]), min(a[3], b[3])]
+                    del regions[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return [tuple(region) for region in regions]
+
+
+def candidate_regions(rgb_frame, prefilter):
+    """Padded (top, right, bottom, left) regions around Haar cascade hits, overlapping regions merged.
+
+    Returns None when the cascade is unavailable, so the caller falls back to
+    scanning the whole frame.
+    """
+    cascade = get_cascade()
+    if cascade is None:
+        return None
+    settings = dict(DEFAULT_PREFILTER, **prefilter)
+    gray = cv2.cvtColor(rgb_frame, cv2.COLOR_RGB2GRAY)
+    min_size = int(settings['min_size'])
+    hits = cascade.detectMultiScale(gray, scaleFactor=settings['scale_factor'],
+                                    minNeighbors=int(settings['min_neighbors']), minSize=(min_size, min_size))
+    height, width = gray.shape
+    # HOG needs context around the face and a region larger than its detection window
+    return merge_regions(pad_region((y, x + w, y + h, x), settings['padding'], settings['min_region'], height, width)
+                         for x, y, w, h in hits)
+
+
+def detect_faces(rgb_frame, model='hog', number_of_times_to_upsample=0, prefilter=None, regions=None):
+    """face_locations, optionally restricted to regions and screened by the Haar cascade first.
+
+    With ``regions`` (e.g. where the scene moved) only those parts of the
+    frame are scanned, grown to the HOG window at this upsampling; an empty
+    list skips detection, and regions covering most of the frame fall back to
+    one full scan. With ``prefilter`` (a dict of DEFAULT_PREFILTER overrides) dlib
+    only scans the padded regions around cascade hits and is skipped entirely
+    when the cascade finds nothing.
+    """
+    if regions is None and prefilter is not None:
+        regions = candidate_regions(rgb_frame, prefilter)
+        prefilter = None
+    if regions is None:
+        return face_recognition.face_locations(rgb_frame, number_of_times_to_upsample, model)
+    height, width = rgb_frame.shape[:2]
+    # Boxes that drifted out of the frame (e.g. tracked faces) have nothing to scan
+    regions = [region for region in regions
+               if region[0] < height and region[1] > 0 and region[2] > 0 and region[3] < width]
+    min_region = -(-HOG_WINDOW // 2 ** number_of_times_to_upsample)
+    regions = merge_regions(pad_region(region, 0.0, min_region, height, width) for region in regions)
+    covered = sum((bottom - top) * (right - left) for top, right, bottom, left in regions)
+    if covered >= FULL_SCAN_COVERAGE * height * width:
+        # Small frames: the crops would save nothing over a single full scan
+        return face_recognition.face_locations(rgb_frame, number_of_times_to_upsample, model)
+    locations = []
+    for top, right, bottom, left in regions:
+        crop = np.ascontiguousarray(rgb_frame[top:bottom, left:right])
+        for t, r, b, l in detect_faces(crop, model, number_of_times_to_upsample, prefilter):
+            locations.append((t + top, r + left, b + top, l + left))
+    return locations
+
+
+def detect_and_encode(rgb_frame, model='hog', number_of_times_to_upsample=0, max_faces=None, encode=True,
+                      skip_boxes=None, skip_iou=0.5, prefilter=None, regions=None, face_size=None):
+    """Run detection and encoding on one (downscaled) RGB frame.
+
+    Returns face locations, one float32 encoding per location and the time
+    spent in each stage in seconds. The encoding is None when encode is False
+    or when the face overlaps one of ``skip_boxes`` (faces already identified
+    by the tracker). ``prefilter`` and ``regions`` restrict detection as in
+    detect_faces. ``face_size`` is a ``(min, max)`` face height in this
+    frame's pixels; other faces are dropped before max_faces and encoding.
+    """
+    start = time.perf_counter()
+    locations = detect_faces(rgb_frame, model, number_of_times_to_upsample, prefilter, regions)
+    if face_size is not None:
+        min_size, max_size = face_size
+        locations = [location for location in locations if min_size <= location[2] - location[0] <= max_size]
+    if max_faces is not None:
+        locations = locations[:max_faces]
+    detected = time.perf_counter()
+
+    encodings = [None] * len(locations)
+    if encode:
+        to_encode = [i for i, location in enumerate(locations)
+                     if not any(box_iou(location, box) >= skip_iou for box in (skip_boxes or ()))]
+        if to_encode:
+            computed = face_recognition.face_encodings(rgb_frame, [locations[i] for i in to_encode])
+            for i, encoding in zip(to_encode, computed):
+                encodings[i] = encoding.astype(np.float32)
+    encoded = time.perf_counter()
+
+    return locations, encodings, {'detect': detected - start, 'encode': encoded - detected}
+
+
+class RecognitionStage:
+    """Runs detect_and_encode on a process pool with latest-frame-wins semantics.
+
+    Frames are submitted per ``source`` (one per camera). At most one frame per
+    source waits for a free worker; submitting a newer frame replaces it. When
+    a worker frees up, the waiting source with the fewest frames in flight gets
+    it, ties going to the source served longest ago, so a camera that submits
+    often cannot starve the others. Results are handed to ``on_result(frame_id,
+    context, locations, encodings, timings)`` from the stage's dispatcher
+    thread, and results older than one already published for the same source
+    are dropped.
+    """
+
+    def __init__(self, on_result, workers=None, model='hog', number_of_times_to_upsample=0, max_faces=None,
+                 prefilter_settings=None):
+        self.on_result = on_result
+        self.prefilter_settings = prefilter_settings or {}
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self.model = model
+        self.number_of_times_to_upsample = number_of_times_to_upsample
+        self.max_faces = max_faces
+        self.frames_submitted = 0
+        self.frames_dropped = 0
+        self.frames_completed = 0
+        self.source_stats = {}  # source -> {'submitted', 'completed', 'dropped'}
+        self._condition = threading.Condition()
+        self._pending = {}         # source -> frame waiting for a worker
+        self._last_dispatch = {}   # source -> dispatch counter when it was last served
+        self._dispatch_count = 0
+        self._executor = None
+        self._thread = None
+        self._running = False
+        self._last_published = {}  # source -> newest published frame_id
+
+    def start(self):
+        with self._condition:
+            if self._running:
+                return
+            # spawn keeps workers independent of the camera and Flask threads in this process
+            self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context('spawn'),
+                                                 initializer=init_worker)
+            # Workers are spawned on demand; start them all now so the models load before the first frame
+            for _ in range(self.workers):
+                self._executor.submit(os.getpid)
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name="recognition-dispatcher", daemon=True)
+            self._thread.start()
+        logger.info(f"Recognition stage started with {self.workers} worker process(es)")
+
+    def stop(self):
+        with self._condition:
+            if not self._running:
+                return
+            self._running = False
+            self._pending = {}
+            self._condition.notify_all()
+        self._thread.join(timeout=5.0)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        logger.info("Recognition stage stopped")
+
+    def submit(self, frame_id, rgb_frame, context=None, encode=True, skip_boxes=None, options=None,
+               source='default'):
+        """Queue a frame for recognition, replacing any frame of the same source still waiting for a worker.
+
+        ``options`` may override ``model``, ``number_of_times_to_upsample`` and
+        ``max_faces`` for this frame; ``prefilter=True`` screens it with the
+        Haar cascade first, ``regions`` limits detection to those boxes and
+        ``face_size`` drops faces outside a (min, max) height.
+        """
+        with self._condition:
+            if not self._running:
+                return False
+            stats = self._stats_for(source)
+            if source in self._pending:
+                self.frames_dropped += 1
+                stats['dropped'] += 1
+            self._pending[source] = (frame_id, rgb_frame, context, encode, skip_boxes, options or {})
+            self.frames_submitted += 1
+            stats['submitted'] += 1
+            self._condition.notify_all()
+        return True
+
+    def _stats_for(self, source):
+        stats = self.source_stats.get(source)
+        if stats is None:
+            stats = self.source_stats[source] = {'submitted': 0, 'completed': 0, 'dropped': 0}
+        return stats
+
+    def _next_source(self, in_flight):
+        """Waiting source with the fewest frames in flight, least recently served first"""
+        busy = {}
+        for source, _, _ in in_flight.values():
+            busy[source] = busy.get(source, 0) + 1
+        return min(self._pending, key=lambda source: (busy.get(source, 0), self._last_dispatch.get(source, -1)))
+
+    def _wake(self, _future):
+        with self._condition:
+            self._condition.notify_all()
+
+    def _run(self):
+        in_flight = {}  # future -> (source, frame_id, context)
+        while True:
+            with self._condition:
+                while self._running and self._pending and len(in_flight) < self.workers:
+                    source = self._next_source(in_flight)
+                    frame_id, rgb_frame, context, encode, skip_boxes, options = self._pending.pop(source)
+                    self._dispatch_count += 1
+                    self._last_dispatch[source] = self._dispatch_count
+                    try:
+                        future = self._executor.submit(
+                            detect_and_encode, rgb_frame,
+                            options.get('model', self.model),
+                            options.get('number_of_times_to_upsample', self.number_of_times_to_upsample),
+                            options.get('max_faces', self.max_faces),
+                            encode, skip_boxes, 0.5,
+                            self.prefilter_settings if options.get('prefilter') else None,
+                            options.get('regions'), options.get('face_size'))
+                    except Exception as e:
+                        logger.error(f"Failed to submit frame for recognition: {e}")
+                        continue
+                    future.add_done_callback(self._wake)
+                    in_flight[future] = (source, frame_id, context)
+
+                if not self._running:
+                    return
+                if not any(future.done() for future in in_flight):
+                    self._condition.wait(timeout=0.5)
+                    continue
+
+            done = sorted((future for future in in_flight if future.done()), key=lambda f: in_flight[f][1])
+            for future in done:
+                source, frame_id, context = in_flight.pop(future)
+                if frame_id < self._last_published.get(source, -1):
+                    # A newer frame of this source already finished; showing this one would go back in time
+                    with self._condition:
+                        self.frames_dropped += 1
+                        self._stats_for(source)['dropped'] += 1
+                    continue
+                try:
+                    locations, encodings, timings = future.result()
+                except Exception as e:
+                    logger.error(f"Recognition worker failed: {e}")
+                    continue
+                self._last_published[source] = frame_id
+                with self._condition:
+                    self.frames_completed += 1
+                    self._stats_for(source)['completed'] += 1
+                try:
+                    self.on_result(frame_id, context, locations, encodings, timings)
+                except Exception as e:
+                    logger.error(f"Error publishing recognition result: {e}")
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""
+Adaptive recognition cadence driven by measured stream and recognition latency
+"""
+
+import math
+import threading
+import time
+
+
+class AdaptiveCadence:
+    """Chooses how many stream frames pass between recognition submissions.
+
+    The stream loop reports every frame it emits and the recognition stage
+    reports the detection/encoding time of every result. Once per
+    ``adjust_every`` seconds the interval moves one step towards the smallest
+    value that (a) keeps the worker pool below ``worker_utilization`` and (b)
+    keeps results younger than ``max_result_age``. If the stream itself falls
+    below ``target_fps`` (the box is CPU bound) the interval backs off further,
+    as far as the freshness limit allows.
+    """
+
+    def __init__(self, interval=3, min_interval=1, max_interval=15, target_fps=20.0,
+                 max_result_age=0.5, worker_utilization=0.8, workers=1, enabled=True,
+                 adjust_every=1.0, smoothing=0.2):
+        self.enabled = enabled
+        self.min_interval = max(1, int(min_interval))
+        self.max_interval = max(self.min_interval, int(max_interval))
+        self.interval = min(max(int(interval), self.min_interval), self.max_interval)
+        self.target_fps = target_fps
+        self.max_result_age = max_result_age
+        self.worker_utilization = worker_utilization
+        # May be fractional: a camera's share of a pool that serves several cameras
+        self.workers = workers if workers > 0 else 1
+        self.adjust_every = adjust_every
+        self.smoothing = smoothing
+        self.lock = threading.Lock()
+        self.frame_period = None
+        self.detect_time = None
+        self.encode_time = None
+        self.result_latency = None
+        self._last_frame_time = None
+        self._last_adjust = time.time()
+
+    def _ewma(self, current, sample):
+        if current is None:
+            return sample
+        return current + self.smoothing * (sample - current)
+
+    def record_frame(self, now=None):
+        """Called by the stream loop once per emitted frame"""
+        now = time.time() if now is None else now
+        with self.lock:
+            if self._last_frame_time is not None:
+                self.frame_period = self._ewma(self.frame_period, now - self._last_frame_time)
+            self._last_frame_time = now
+            if now - self._last_adjust >= self.adjust_every:
+                self._last_adjust = now
+                self._adjust()
+
+    def record_result(self, timings, latency):
+        """Called for every recognition result with per-stage timings and submit-to-publish latency"""
+        with self.lock:
+            self.detect_time = self._ewma(self.detect_time, timings['detect'])
+            self.encode_time = self._ewma(self.encode_time, timings['encode'])
+            self.result_latency = self._ewma(self.result_latency, latency)
+
+    def should_process(self, frame_number):
+        return frame_number % self.interval == 0
+
+    def _adjust(self):
+        if not self.enabled or self.frame_period is None or self.detect_time is None:
+            return
+        frame_period = max(self.frame_period, 1e-3)
+        cost = self.detect_time + self.encode_time
+
+        # Smallest interval the worker pool can sustain
+        capacity_interval = math.ceil(cost / (self.workers * frame_period * self.worker_utilization))
+        # Largest interval that still delivers results fresh enough
+        freshness_interval = math.floor((self.max_result_age - (self.result_latency or cost)) / frame_period)
+
+        target = max(capacity_interval, self.min_interval)
+        stream_fps = 1.0 / frame_period
+        if stream_fps < self.target_fps * 0.9:
+            # The stream is starving for CPU: process less often, but not so rarely results go stale
+            target = max(target, min(self.interval + 1, max(freshness_interval, capacity_interval)))
+        elif stream_fps < self.target_fps:
+            # Close to target - hold rather than oscillate
+            target = max(target, self.interval)
+        target = min(max(target, self.min_interval), self.max_interval)
+
+        # One step per adjustment keeps the cadence from oscillating
+        if target > self.interval:
+            self.interval += 1
+        elif target < self.interval:
+            self.interval -= 1
+
+    def stats(self):
+        with self.lock:
+            def ms(value):
+                return round(value * 1000, 1) if value is not None else None
+            return {
+                'adaptive': self.enabled,
+                'process_every_n_frames': self.interval,
+                'min_interval': self.min_interval,
+                'max_interval': self.max_interval,
+                'stream_fps': round(1.0 / self.frame_period, 1) if self.frame_period else 0.0,
+                'target_fps': self.target_fps,
+                'detect_ms': ms(self.detect_time),
+                'encode_ms': ms(self.encode_time),
+                'result_latency_ms': ms(self.result_latency),
+                'result_age_ms': ms(self.interval * self.frame_period + self.result_latency)
+                if self.frame_period and self.result_latency is not None else None,
+                'workers': self.workers,
+            }
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+"""
+MJPEG broadcast hub shared by all /video_feed viewers
+"""
+
+import itertools
+import threading
+import time
+
+# Shared renditions, largest first: scale of the camera frame and JPEG quality
+# (None keeps the pipeline profile's quality)
+DEFAULT_RENDITIONS = {
+    'full': {'scale': 1.0, 'jpeg_quality': None},
+    'half': {'scale': 0.5, 'jpeg_quality': 70},
+    'thumb': {'scale': 0.25, 'jpeg_quality': 60},
+}
+
+
+class Viewer:
+    """Delivery state of one MJPEG client"""
+
+    def __init__(self, viewer_id, rendition, auto):
+        self.viewer_id = viewer_id
+        self.rendition = rendition
+        self.auto = auto
+        self.connected_at = time.monotonic()
+        self.frames_sent = 0
+        self.frames_skipped = 0
+        self.bytes_sent = 0
+        self.lag = None          # EWMA of send time / producer frame interval
+        self.send_rate = None    # EWMA of bytes per second while writing
+        self.lagging_since = None
+        self.keeping_up_since = None
+        self.switched_at = self.connected_at
+
+
+class FrameBroadcaster:
+    """Hands the latest encoded frame to every subscribed viewer.
+
+    The producer encodes each annotated frame once per rendition and publishes
+    the complete multipart chunks; viewers only wait for the next sequence
+    number of their rendition and yield the same bytes object, so an extra
+    viewer costs no extra encoding. ``wanted_renditions`` only reports
+    renditions with a viewer that is ready for a frame, so a viewer still
+    busy writing the previous one (a slow or stalled client) costs no
+    encoding, and it skips to the newest frame instead of queueing.
+
+    Viewers in auto mode measure how long each frame takes to write relative
+    to the producer's frame interval. A viewer that keeps falling behind for
+    ``adapt_seconds`` moves to the next smaller rendition, and one with ample
+    headroom for three times as long moves back up.
+    """
+
+    def __init__(self, renditions=None, default_rendition='full', adaptive=True, downgrade_lag=1.5,
+                 upgrade_lag=0.3, adapt_seconds=3.0, smoothing=0.3):
+        self.renditions = dict(renditions or DEFAULT_RENDITIONS)
+        self.default_rendition = default_rendition if default_rendition in self.renditions else next(iter(self.renditions))
+        self.adaptive = adaptive
+        self.downgrade_lag = downgrade_lag
+        self.upgrade_lag = upgrade_lag
+        self.adapt_seconds = adapt_seconds
+        self.smoothing = smoothing
+        self.frames_skipped = 0
+        self.rendition_switches = 0
+        self._order = list(self.renditions)
+        self._condition = threading.Condition()
+        self._chunks = {}  # rendition -> (seq, chunk)
+        self._seq = 0
+        self._waiting = {name: 0 for name in self.renditions}
+        self._viewers = {}
+        self._ids = itertools.count(1)
+        self._frame_interval = None
+        self._last_publish = None
+
+    @property
+    def subscriber_count(self):
+        with self._condition:
+            return len(self._viewers)
+
+    def wanted_renditions(self):
+        """Renditions that at least one viewer is waiting for"""
+        with self._condition:
+            return [name for name in self._order if self._waiting[name]]
+
+    def viewer_counts(self):
+        """Connected viewers per rendition"""
+        with self._condition:
+            counts = {name: 0 for name in self._order}
+            for viewer in self._viewers.values():
+                counts[viewer.rendition] += 1
+            return counts
+
+    def viewer_stats(self):
+        now = time.monotonic()
+        with self._condition:
+            return [{'id': viewer.viewer_id,
+                     'rendition': viewer.rendition,
+                     'auto': viewer.auto,
+                     'frames_sent': viewer.frames_sent,
+                     'frames_skipped': viewer.frames_skipped,
+                     'fps': round(viewer.frames_sent / max(now - viewer.connected_at, 1e-3), 1),
+                     'kbps': round(viewer.send_rate * 8 / 1000, 1) if viewer.send_rate else None,
+                     'lag': round(viewer.lag, 2) if viewer.lag is not None else None}
+                    for viewer in self._viewers.values()]
+
+    @staticmethod
+    def _chunk(jpeg_bytes):
+        return b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + jpeg_bytes + b'\r\n'
+
+    def publish(self, jpeg_bytes):
+        """Publish one JPEG-encoded frame of the default rendition to all viewers"""
+        self.publish_renditions({self.default_rendition: jpeg_bytes})
+
+    def publish_renditions(self, frames):
+        """Publish one frame as ``{rendition: jpeg_bytes}``, normally the renditions from wanted_renditions"""
+        now = time.monotonic()
+        chunks = {name: self._chunk(jpeg_bytes) for name, jpeg_bytes in frames.items()}
+        with self._condition:
+            if self._last_publish is not None:
+                interval = now - self._last_publish
+                if self._frame_interval is None:
+                    self._frame_interval = interval
+                else:
+                    self._frame_interval += self.smoothing * (interval - self._frame_interval)
+            self._last_publish = now
+            self._seq += 1
+            for name, chunk in chunks.items():
+                self._chunks[name] = (self._seq, chunk)
+            self._condition.notify_all()
+
+    def _record_send(self, viewer, size, seconds, now):
+        """Update a viewer's throughput after one frame was written; called with the lock held"""
+        viewer.frames_sent += 1
+        viewer.bytes_sent += size
+        if seconds > 0:
+            rate = size / seconds
+            viewer.send_rate = rate if viewer.send_rate is None else viewer.send_rate + self.smoothing * (rate - viewer.send_rate)
+        if not self._frame_interval:
+            return
+        lag = seconds / self._frame_interval
+        viewer.lag = lag if viewer.lag is None else viewer.lag + self.smoothing * (lag - viewer.lag)
+        if not (self.adaptive and viewer.auto):
+            return
+
+        viewer.lagging_since = (viewer.lagging_since or now) if viewer.lag > self.downgrade_lag else None
+        viewer.keeping_up_since = (viewer.keeping_up_since or now) if viewer.lag < self.upgrade_lag else None
+        index = self._order.index(viewer.rendition)
+        if now - viewer.switched_at < self.adapt_seconds:
+            return
+        if viewer.lagging_since and now - viewer.lagging_since >= self.adapt_seconds and index < len(self._order) - 1:
+            self._switch(viewer, self._order[index + 1], now)
+        elif viewer.keeping_up_since and now - viewer.keeping_up_since >= 3 * self.adapt_seconds and index > 0:
+            self._switch(viewer, self._order[index - 1], now)
+
+    def _switch(self, viewer, rendition, now):
+        viewer.rendition = rendition
+        viewer.switched_at = now
+        viewer.lagging_since = None
+        viewer.keeping_up_since = None
+        viewer.lag = None
+        self.rendition_switches += 1
+
+    def subscribe(self, rendition=None, timeout=5.0):
+        """Generator yielding multipart chunks of one rendition (None adapts to the viewer's throughput).
+
+        Only the newest frame is ever sent; frames published while the viewer
+        was still writing are skipped.
+        """
+        if rendition is not None and rendition not in self.renditions:
+            raise ValueError(f"Unknown rendition: {rendition}")
+        with self._condition:
+            viewer = Viewer(next(self._ids), rendition or self.default_rendition, rendition is None)
+            self._viewers[viewer.viewer_id] = viewer
+        try:
+            last_seq = 0
+            while True:
+                with self._condition:
+                    name = viewer.rendition
+                    self._waiting[name] += 1
+                    try:
+                        ready = self._condition.wait_for(
+                            lambda: self._chunks.get(name, (last_seq,))[0] > last_seq, timeout)
+                    finally:
+                        self._waiting[name] -= 1
+                    if not ready:
+                        continue
+                    seq, chunk = self._chunks[name]
+                    if last_seq:
+                        skipped = seq - last_seq - 1
+                        viewer.frames_skipped += skipped
+                        self.frames_skipped += skipped
+                    last_seq = seq
+                start = time.monotonic()
+                yield chunk
+                now = time.monotonic()
+                with self._condition:
+                    self._record_send(viewer, len(chunk), now - start, now)
+        finally:
+            with self._condition:
+                self._viewers.pop(viewer.viewer_id, None)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+"""
+Lightweight multi-face tracker that keeps identities between processed frames
+"""
+
+import itertools
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+def box_iou(a, b):
+    """Intersection over union of two (top, right, bottom, left) boxes"""
+    top = max(a[0], b[0])
+    right = min(a[1], b[1])
+    bottom = min(a[2], b[2])
+    left = max(a[3], b[3])
+    intersection = max(0, right - left) * max(0, bottom - top)
+    if intersection == 0:
+        return 0.0
+    area_a = (a[1] - a[3]) * (a[2] - a[0])
+    area_b = (b[1] - b[3]) * (b[2] - b[0])
+    return intersection / float(area_a + area_b - intersection)
+
+
+class Track:
+    """One face followed across frames"""
+
+    def __init__(self, track_id, location, name, confidence, verified_at):
+        self.track_id = track_id
+        self.location = location
+        self.name = name
+        self.confidence = confidence
+        self.verified_at = verified_at
+        self.missed = 0
+
+
+class FaceTracker:
+    """Associates detections with existing tracks by IoU.
+
+    Tracks whose identity was confirmed by a confident match recently enough
+    are reported by ``verified_boxes`` so the recognition stage can skip
+    encoding them. Optionally moves boxes with sparse optical flow on frames
+    that are not processed.
+    """
+
+    def __init__(self, iou_threshold=0.3, min_confidence=0.65, reverify_seconds=2.0,
+                 max_missed=2, optical_flow=True):
+        self.iou_threshold = iou_threshold
+        self.min_confidence = min_confidence
+        self.reverify_seconds = reverify_seconds
+        self.max_missed = max_missed
+        self.optical_flow = optical_flow
+        self.lock = threading.Lock()
+        self._tracks = []
+        self._ids = itertools.count(1)
+        self._prev_gray = None
+
+    def verified_boxes(self, now=None):
+        """Boxes of confidently identified tracks that do not need re-encoding yet"""
+        now = time.time() if now is None else now
+        with self.lock:
+            return [track.location for track in self._tracks
+                    if track.name != "Unknown" and track.confidence >= self.min_confidence
+                    and now - track.verified_at < self.reverify_seconds]
+
+    def update(self, detections, now=None):
+        """Update tracks with the detections of one processed frame.
+
+        ``detections`` is a list of ``(location, name, confidence)``; name is
+        None when the face was not encoded because it belongs to a verified
+        track, in which case the track keeps its identity.
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            pairs = sorted(((box_iou(track.location, detection[0]), t, d)
+                            for t, track in enumerate(self._tracks)
+                            for d, detection in enumerate(detections)), reverse=True)
+            matched_tracks = set()
+            matched_detections = set()
+            for iou, t, d in pairs:
+                if iou < self.iou_threshold:
+                    break
+                if t in matched_tracks or d in matched_detections:
+                    continue
+                matched_tracks.add(t)
+                matched_detections.add(d)
+                track = self._tracks[t]
+                location, name, confidence = detections[d]
+                track.location = location
+                track.missed = 0
+                if name is not None:
+                    track.name = name
+                    track.confidence = confidence
+                    track.verified_at = now
+
+            tracks = []
+            for t, track in enumerate(self._tracks):
+                if t not in matched_tracks:
+                    track.missed += 1
+                if track.missed <= self.max_missed:
+                    tracks.append(track)
+            for d, (location, name, confidence) in enumerate(detections):
+                if d not in matched_detections:
+                    if name is None:
+                        name, confidence = "Unknown", 0.0
+                    tracks.append(Track(next(self._ids), location, name, confidence, now))
+            self._tracks = tracks
+
+    def predict(self, frame):
+        """Move track boxes along the sparse optical flow between consecutive frames"""
+        if not self.optical_flow:
+            return
+        # Half resolution is plenty for box-level motion
+        gray = cv2.cvtColor(cv2.resize(frame, (0, 0), fx=0.5, fy=0.5), cv2.COLOR_BGR2GRAY)
+        prev_gray, self._prev_gray = self._prev_gray, gray
+        if prev_gray is None or prev_gray.shape != gray.shape:
+            return
+
+        with self.lock:
+            for track in self._tracks:
+                top, right, bottom, left = (v // 2 for v in track.location)
+                mask = np.zeros_like(prev_gray)
+                mask[max(0, top):max(0, bottom), max(0, left):max(0, right)] = 255
+                points = cv2.goodFeaturesToTrack(prev_gray, maxCorners=20, qualityLevel=0.01,
+                                                 minDistance=3, mask=mask)
+                if points is None:
+                    continue
+                moved, status, _ = cv2.calcOpticalFlowPyrLK(prev_gray, gray, points, None)
+                good = status.reshape(-1) == 1
+                if not good.any():
+                    continue
+                dx, dy = np.median((moved - points).reshape(-1, 2)[good], axis=0) * 2
+                dx, dy = int(round(dx)), int(round(dy))
+                top, right, bottom, left = track.location
+                track.location = (top + dy, right + dx, bottom + dy, left + dx)
+
+    def faces(self):
+        """Current tracks as face dicts for drawing and stats"""
+        with self.lock:
+            return [{'location': track.location, 'name': track.name, 'confidence': track.confidence,
+                     'track_id': track.track_id}
+                    for track in self._tracks]